@@ -0,0 +1,60 @@
+"""Add user_scores table
+
+Revision ID: 0b6e4d2f9a15
+Revises: f3a8c2d91b67
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b6e4d2f9a15'
+down_revision: Union[str, Sequence[str], None] = 'f3a8c2d91b67'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    user_scores = op.create_table('user_scores',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.Column('machine_flags', sa.Integer(), nullable=False),
+    sa.Column('challenge_solves', sa.Integer(), nullable=False),
+    sa.Column('last_solve_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill from existing solves: one point per machine flag, a challenge's points once per challenge
+    bind = op.get_bind()
+    scores = {}
+    machine_rows = bind.execute(sa.text(
+        "SELECT user_id, COUNT(DISTINCT flag_id), MAX(created_at) FROM submissions "
+        "WHERE user_id IS NOT NULL GROUP BY user_id"
+    )).all()
+    for user_id, flags, solved_at in machine_rows:
+        scores[user_id] = {"user_id": user_id, "score": flags, "machine_flags": flags, "challenge_solves": 0, "last_solve_at": solved_at}
+    challenge_rows = bind.execute(sa.text(
+        "SELECT solved.user_id, COUNT(*), SUM(COALESCE(challenges.points, 0)), MAX(solved.first_at) "
+        "FROM (SELECT user_id, challenge_id, MIN(created_at) AS first_at FROM challenge_submissions "
+        "WHERE is_correct = true AND user_id IS NOT NULL GROUP BY user_id, challenge_id) AS solved "
+        "JOIN challenges ON challenges.id = solved.challenge_id GROUP BY solved.user_id"
+    )).all()
+    for user_id, solves, points, solved_at in challenge_rows:
+        entry = scores.setdefault(user_id, {"user_id": user_id, "score": 0, "machine_flags": 0, "challenge_solves": 0, "last_solve_at": None})
+        entry["score"] += points or 0
+        entry["challenge_solves"] = solves
+        if entry["last_solve_at"] is None or (solved_at is not None and solved_at > entry["last_solve_at"]):
+            entry["last_solve_at"] = solved_at
+    if scores:
+        op.bulk_insert(user_scores, list(scores.values()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_scores')
@@ -0,0 +1,33 @@
+"""Add unique (user_id, flag_id) to submissions
+
+Revision ID: 1c7e5a3b9d40
+Revises: 0b6e4d2f9a15
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c7e5a3b9d40'
+down_revision: Union[str, Sequence[str], None] = '0b6e4d2f9a15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Concurrent submits could slip a repeat past the old check; keep the earliest of each
+    op.execute(sa.text(
+        "DELETE FROM submissions WHERE flag_id IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM submissions WHERE flag_id IS NOT NULL GROUP BY user_id, flag_id)"
+    ))
+    op.create_unique_constraint('uq_submissions_user_flag', 'submissions', ['user_id', 'flag_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_submissions_user_flag', 'submissions', type_='unique')
@@ -0,0 +1,50 @@
+"""Add daily rollup tables
+
+Revision ID: 2d8f6b4c0e71
+Revises: 1c7e5a3b9d40
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d8f6b4c0e71'
+down_revision: Union[str, Sequence[str], None] = '1c7e5a3b9d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled by revision 7a4c2e9b1f38; the running app keeps the recent days current
+    op.create_table('daily_registrations',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('users', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('daily_activity',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('target_type', sa.String(), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('submissions', sa.Integer(), nullable=False),
+    sa.Column('correct', sa.Integer(), nullable=False),
+    sa.Column('new_attempters', sa.Integer(), nullable=False),
+    sa.Column('new_solvers', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'target_type', 'target_id')
+    )
+    op.create_index(op.f('ix_users_created_at'), 'users', ['created_at'], unique=False)
+    op.create_index(op.f('ix_submissions_created_at'), 'submissions', ['created_at'], unique=False)
+    op.create_index(op.f('ix_challenge_submissions_created_at'), 'challenge_submissions', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_challenge_submissions_created_at'), table_name='challenge_submissions')
+    op.drop_index(op.f('ix_submissions_created_at'), table_name='submissions')
+    op.drop_index(op.f('ix_users_created_at'), table_name='users')
+    op.drop_table('daily_activity')
+    op.drop_table('daily_registrations')
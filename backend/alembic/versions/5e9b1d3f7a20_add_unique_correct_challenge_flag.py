@@ -0,0 +1,37 @@
+"""Add unique correct (user_id, challenge_flag_id) to challenge_submissions
+
+Revision ID: 5e9b1d3f7a20
+Revises: 2d8f6b4c0e71
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9b1d3f7a20'
+down_revision: Union[str, Sequence[str], None] = '2d8f6b4c0e71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Concurrent submits could record the same correct flag twice; keep the earliest of each
+    op.execute(sa.text(
+        "DELETE FROM challenge_submissions WHERE is_correct AND challenge_flag_id IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM challenge_submissions WHERE is_correct AND challenge_flag_id IS NOT NULL "
+        "GROUP BY user_id, challenge_flag_id)"
+    ))
+    op.create_index(
+        'uq_challenge_submissions_user_flag_correct', 'challenge_submissions', ['user_id', 'challenge_flag_id'],
+        unique=True, postgresql_where=sa.text('is_correct'), sqlite_where=sa.text('is_correct'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_challenge_submissions_user_flag_correct', table_name='challenge_submissions')
@@ -0,0 +1,77 @@
+"""Backfill daily rollup tables
+
+Revision ID: 7a4c2e9b1f38
+Revises: 5e9b1d3f7a20
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4c2e9b1f38'
+down_revision: Union[str, Sequence[str], None] = '5e9b1d3f7a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# A frozen copy of rollups.rebuild as of this revision. Each submission counts as a
+# new attempter (solver) when the user has no earlier (correct) submission on the target.
+# Machine submissions only ever record correct flags, so every one is also a solve
+FIRST_MACHINE_SUBMISSION = """
+    COUNT(DISTINCT CASE WHEN NOT EXISTS (
+        SELECT 1 FROM submissions AS earlier
+        WHERE earlier.user_id = s.user_id AND earlier.machine_id = s.machine_id AND earlier.created_at < s.created_at
+    ) THEN s.user_id END)
+"""
+
+MACHINE_ACTIVITY = f"""
+INSERT INTO daily_activity (day, target_type, target_id, submissions, correct, new_attempters, new_solvers)
+SELECT
+    date(s.created_at), 'machine', s.machine_id, COUNT(s.id), COUNT(s.id),
+    {FIRST_MACHINE_SUBMISSION}, {FIRST_MACHINE_SUBMISSION}
+FROM submissions AS s
+WHERE s.created_at IS NOT NULL AND s.machine_id IS NOT NULL
+GROUP BY date(s.created_at), s.machine_id
+"""
+
+CHALLENGE_ACTIVITY = """
+INSERT INTO daily_activity (day, target_type, target_id, submissions, correct, new_attempters, new_solvers)
+SELECT
+    date(s.created_at), 'challenge', s.challenge_id, COUNT(s.id),
+    COUNT(CASE WHEN s.is_correct THEN 1 END),
+    COUNT(DISTINCT CASE WHEN NOT EXISTS (
+        SELECT 1 FROM challenge_submissions AS earlier
+        WHERE earlier.user_id = s.user_id AND earlier.challenge_id = s.challenge_id AND earlier.created_at < s.created_at
+    ) THEN s.user_id END),
+    COUNT(DISTINCT CASE WHEN s.is_correct AND NOT EXISTS (
+        SELECT 1 FROM challenge_submissions AS earlier
+        WHERE earlier.user_id = s.user_id AND earlier.challenge_id = s.challenge_id AND earlier.is_correct AND earlier.created_at < s.created_at
+    ) THEN s.user_id END)
+FROM challenge_submissions AS s
+WHERE s.created_at IS NOT NULL AND s.challenge_id IS NOT NULL
+GROUP BY date(s.created_at), s.challenge_id
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The dashboard's all-time totals are sums over the rollups, so they must cover every day
+    # before the app starts; the aggregator only keeps the trailing days current.
+    op.execute(sa.text("DELETE FROM daily_activity"))
+    op.execute(sa.text("DELETE FROM daily_registrations"))
+    op.execute(sa.text(
+        "INSERT INTO daily_registrations (day, users) "
+        "SELECT date(created_at), COUNT(id) FROM users WHERE created_at IS NOT NULL GROUP BY date(created_at)"
+    ))
+    op.execute(sa.text(MACHINE_ACTIVITY))
+    op.execute(sa.text(CHALLENGE_ACTIVITY))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DELETE FROM daily_activity"))
+    op.execute(sa.text("DELETE FROM daily_registrations"))
@@ -0,0 +1,43 @@
+"""Add unique pending instance per user and target
+
+Revision ID: 9c3e5a7b2d14
+Revises: 7a4c2e9b1f38
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5a7b2d14'
+down_revision: Union[str, Sequence[str], None] = '7a4c2e9b1f38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PENDING = "status IN ('queued', 'starting', 'running', 'stopping')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for column in ('machine_id', 'challenge_id'):
+        # Concurrent requests could queue the same target twice; keep the earliest. A later
+        # duplicate that already started shows up as failed, and stopping it removes its container.
+        op.execute(sa.text(
+            f"UPDATE instances SET status = 'failed', error = 'Duplicate of an earlier request' "
+            f"WHERE {column} IS NOT NULL AND {PENDING} AND id NOT IN ("
+            f"SELECT MIN(id) FROM instances WHERE {column} IS NOT NULL AND {PENDING} GROUP BY user_id, {column})"
+        ))
+        where = sa.text(f"{column} IS NOT NULL AND {PENDING}")
+        op.create_index(
+            f"uq_instances_user_{column.removesuffix('_id')}_pending", 'instances', ['user_id', column],
+            unique=True, postgresql_where=where, sqlite_where=where,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_instances_user_challenge_pending', table_name='instances')
+    op.drop_index('uq_instances_user_machine_pending', table_name='instances')
@@ -0,0 +1,52 @@
+"""Add instances table
+
+Revision ID: c41e7a9d2b58
+Revises: 61002433d8cb
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41e7a9d2b58'
+down_revision: Union[str, Sequence[str], None] = '61002433d8cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('instances',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('machine_id', sa.Integer(), nullable=True),
+    sa.Column('challenge_id', sa.Integer(), nullable=True),
+    sa.Column('container_name', sa.String(), nullable=True),
+    sa.Column('ip_address', sa.String(), nullable=True),
+    sa.Column('host', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('cpu', sa.Float(), nullable=True),
+    sa.Column('memory_mb', sa.Integer(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['challenge_id'], ['challenges.id'], ),
+    sa.ForeignKeyConstraint(['machine_id'], ['machines.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_instances_id'), 'instances', ['id'], unique=False)
+    op.create_index(op.f('ix_instances_user_id'), 'instances', ['user_id'], unique=False)
+    op.create_index(op.f('ix_instances_status'), 'instances', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_instances_status'), table_name='instances')
+    op.drop_index(op.f('ix_instances_user_id'), table_name='instances')
+    op.drop_index(op.f('ix_instances_id'), table_name='instances')
+    op.drop_table('instances')
@@ -0,0 +1,36 @@
+"""Add lease expiry to active users and instances
+
+Revision ID: d7a3f0c6e912
+Revises: c41e7a9d2b58
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7a3f0c6e912'
+down_revision: Union[str, Sequence[str], None] = 'c41e7a9d2b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('active_machines', 'active_challenges', 'instances'):
+        op.add_column(table, sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True))
+        op.create_index(op.f(f'ix_{table}_expires_at'), table, ['expires_at'], unique=False)
+    # Existing sessions get a fresh lease instead of being reaped on the first sweep
+    op.execute("UPDATE active_machines SET expires_at = now() + interval '2 hours'")
+    op.execute("UPDATE active_challenges SET expires_at = now() + interval '2 hours'")
+    op.execute("UPDATE instances SET expires_at = now() + interval '2 hours' WHERE status = 'running'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('instances', 'active_challenges', 'active_machines'):
+        op.drop_index(op.f(f'ix_{table}_expires_at'), table_name=table)
+        op.drop_column(table, 'expires_at')
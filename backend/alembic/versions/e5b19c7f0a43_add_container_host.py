@@ -0,0 +1,31 @@
+"""Record the Docker host running each machine and challenge
+
+Revision ID: e5b19c7f0a43
+Revises: d7a3f0c6e912
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b19c7f0a43'
+down_revision: Union[str, Sequence[str], None] = 'd7a3f0c6e912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NULL means the default host, which is where every existing container runs
+    op.add_column('machines', sa.Column('host', sa.String(), nullable=True))
+    op.add_column('challenges', sa.Column('host', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('challenges', 'host')
+    op.drop_column('machines', 'host')
@@ -0,0 +1,141 @@
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+from rollups import midnight
+
+ANALYTICS_MAX_DAYS = 365
+# The "this week" figures on the dashboard cards
+RECENT_DAYS = 7
+
+
+def window_start(days: int) -> date:
+    """First day of a window of `days` days ending today (UTC)."""
+    return datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+
+
+def fill_days(counts: dict[date, int], since: date) -> list[dict]:
+    """One point per day from `since` to today, zero where nothing happened."""
+    today = datetime.now(timezone.utc).date()
+    return [
+        {"date": (since + timedelta(days=offset)).isoformat(), "count": counts.get(since + timedelta(days=offset), 0)}
+        for offset in range((today - since).days + 1)
+    ]
+
+
+def _registrations(db: Session, since: date) -> dict[date, int]:
+    rows = db.execute(
+        select(models.DailyRegistration.day, models.DailyRegistration.users)
+        .where(models.DailyRegistration.day >= since)
+    ).all()
+    return {day: users for day, users in rows}
+
+
+def _machine_submissions(db: Session, since: date) -> dict[date, int]:
+    rows = db.execute(
+        select(models.DailyActivity.day, func.sum(models.DailyActivity.submissions))
+        .where(models.DailyActivity.target_type == "machine", models.DailyActivity.day >= since)
+        .group_by(models.DailyActivity.day)
+    ).all()
+    return {day: count for day, count in rows}
+
+
+def _machine_activity(db: Session, since: date):
+    """Summed machine rollups over the window, one row per machine."""
+    return (
+        select(
+            models.DailyActivity.target_id.label("machine_id"),
+            func.sum(models.DailyActivity.submissions).label("submissions"),
+            func.sum(models.DailyActivity.new_attempters).label("attempted"),
+            func.sum(models.DailyActivity.new_solvers).label("completed"),
+        )
+        .where(models.DailyActivity.target_type == "machine", models.DailyActivity.day >= since)
+        .group_by(models.DailyActivity.target_id)
+        .subquery()
+    )
+
+
+def completion_rates(db: Session, since: date) -> list[dict]:
+    """Per-machine completion for users who first attempted the machine in the window."""
+    activity = _machine_activity(db, since)
+    rows = db.execute(
+        select(models.Machine.name, func.coalesce(activity.c.completed, 0), func.coalesce(activity.c.attempted, 0))
+        .outerjoin(activity, activity.c.machine_id == models.Machine.id)
+        .order_by(models.Machine.id)
+    ).all()
+    return [
+        {
+            "name": name,
+            "completion_rate": round(completed / attempted * 100, 2) if attempted else 0,
+            "completed_count": completed,
+            "total_users_attempted": attempted,
+        }
+        for name, completed, attempted in rows
+    ]
+
+
+def machine_popularity(db: Session, since: date, limit: int = 5) -> list[dict]:
+    activity = _machine_activity(db, since)
+    rows = db.execute(
+        select(models.Machine.name, activity.c.submissions)
+        .join(activity, activity.c.machine_id == models.Machine.id)
+        .order_by(activity.c.submissions.desc())
+        .limit(limit)
+    ).all()
+    return [{"name": name, "submission_count": submission_count} for name, submission_count in rows]
+
+
+def top_users(db: Session, since: date, limit: int = 5) -> list[dict]:
+    # Per-user counts are not rolled up; the created_at index keeps this to the window's rows
+    count = func.count(models.Submission.id)
+    rows = db.execute(
+        select(models.User.username, count)
+        .join(models.Submission)
+        .where(models.Submission.created_at >= midnight(since))
+        .group_by(models.User.username)
+        .order_by(count.desc())
+        .limit(limit)
+    ).all()
+    return [{"username": username, "submission_count": submission_count} for username, submission_count in rows]
+
+
+def dashboard(db: Session, days: int) -> dict:
+    """Everything the admin analytics page shows, for the last `days` days.
+
+    Trends, popularity and completion rates read the daily rollup tables, so
+    their cost grows with the number of days rather than the number of rows
+    behind them. Totals are all-time; the rest cover the window.
+    """
+    since = window_start(days)
+    recent = window_start(RECENT_DAYS)
+    first = min(since, recent)
+
+    registrations = _registrations(db, first)
+    submissions = _machine_submissions(db, first)
+    total_users = db.scalar(select(func.coalesce(func.sum(models.DailyRegistration.users), 0)))
+    total_submissions = db.scalar(
+        select(func.coalesce(func.sum(models.DailyActivity.submissions), 0))
+        .where(models.DailyActivity.target_type == "machine")
+    )
+    now = datetime.now(timezone.utc)
+    total_machines, new_machines = db.execute(
+        select(func.count(models.Machine.id), func.count(models.Machine.id).filter(models.Machine.release_date.between(midnight(recent), now)))
+    ).one()
+
+    return {
+        "days": days,
+        "total_users": total_users,
+        "total_machines": total_machines,
+        "total_submissions": total_submissions,
+        "new_users_trend": sum(count for day, count in registrations.items() if day >= recent),
+        "new_machines_trend": new_machines,
+        "new_submissions_trend": sum(count for day, count in submissions.items() if day >= recent),
+        "user_registration_trends": fill_days(registrations, since),
+        "submission_trends": fill_days(submissions, since),
+        # Submissions stand in for popularity until machine starts are tracked
+        "machine_popularity": machine_popularity(db, since),
+        "top_users": top_users(db, since),
+        "machine_completion_rates": completion_rates(db, since),
+    }
@@ -1,17 +1,31 @@
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+import asyncio
+import os
+import threading
+import time
+import uuid
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, APIRouter 
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import models, database, schemas 
+from revocation import revocation_store
 from pydantic import BaseModel
 
 # Secret key to sign the JWT token
 SECRET_KEY = "Thi$i$SwcureKey"  # Replace with a real secret key in production
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 1440
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "1000"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -21,10 +35,154 @@ auth_router = APIRouter() # Define APIRouter
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+    expires_in: int | None = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: str | None = None
 
 class TokenData(BaseModel):
     username: str | None = None
 
+class Principal:
+    """The authenticated user, detached from any DB session so it can be cached.
+
+    Handlers only read its attributes; the few that change relationships load
+    the ORM row with `load_user`.
+    """
+    __slots__ = ("id", "username", "email", "role", "created_at")
+
+    def __init__(self, user: models.User):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.created_at = user.created_at
+
+class PrincipalCache:
+    """Principals by user id, so most requests authenticate without a query.
+
+    Entries live for PRINCIPAL_CACHE_TTL seconds, which bounds how stale a role
+    can be in other worker processes; this process drops an entry as soon as
+    the user is changed or deleted.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Principal | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return principal
+
+    def set(self, principal: Principal):
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int | None = None):
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+principal_cache = PrincipalCache()
+
+def load_user(db: Session, principal: Principal) -> models.User:
+    """The session-bound user row behind a principal, for relationship changes."""
+    user = db.get(models.User, principal.id)
+    if user is None:
+        principal_cache.invalidate(principal.id)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return user
+
+class PasswordWorkerPool:
+    """Runs bcrypt on a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL, so throughput scales with the number of workers
+    while the event loop and the request threadpool stay free. Once
+    PASSWORD_HASH_MAX_QUEUE calls are waiting, new ones get a 503 instead of
+    piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._peak_queued = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many logins in progress, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+        return self._executor.submit(self._run, time.monotonic(), fn, *args)
+
+    def _run(self, submitted_at: float, fn, *args):
+        started_at = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_seconds += started_at - submitted_at
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_seconds += time.monotonic() - started_at
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def run_sync(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            completed = self._completed
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "peak_queued": self._peak_queued,
+                "completed": completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_seconds / completed * 1000, 2) if completed else 0.0,
+                "avg_run_ms": round(self._run_seconds / completed * 1000, 2) if completed else 0.0,
+            }
+
+password_pool = PasswordWorkerPool()
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -37,11 +195,47 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"sub": data["sub"], "role": data.get("role", "user"), "id": data["id"]})
+    # iat keeps sub-second precision so a revocation cut-off cannot catch tokens issued right after it
+    to_encode.update({
+        "sub": data["sub"], "role": data.get("role", "user"), "id": data["id"],
+        "exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex, "type": "access"
+    })
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def create_refresh_token(user: models.User):
+    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {"sub": user.username, "id": user.id, "exp": expire, "iat": time.time(), "jti": uuid.uuid4().hex, "type": "refresh"}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def issue_tokens(user: models.User) -> dict:
+    access_token = create_access_token(
+        data={"sub": user.username, "role": user.role, "id": user.id}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": create_refresh_token(user),
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def revoke_token(db: Session, payload: dict) -> bool:
+    """Revoke one decoded token until it would have expired anyway.
+
+    Returns False if the token was already revoked, so single-use tokens can be
+    refused when two requests race to use the same one.
+    """
+    if payload.get("jti") is None or payload.get("exp") is None:
+        return False
+    if revocation_store.is_revoked(payload["jti"]):
+        return False
+    return revocation_store.revoke(db, payload["jti"], datetime.fromtimestamp(payload["exp"], tz=timezone.utc))
+
+def revoke_user_tokens(db: Session, user_id: int):
+    """Reject every access token the user currently holds; refresh re-reads the user."""
+    revocation_store.revoke_user(db, user_id, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -50,17 +244,41 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        user_id = payload.get("id")
+        if username is None or user_id is None:
+            raise credentials_exception
+        # Tokens issued before refresh tokens existed carry no type and count as access tokens
+        if payload.get("type", "access") != "access":
             raise credentials_exception
-        user = db.query(models.User).filter(models.User.username == username).first()
-        if user is None:
+        # Both checks are in memory; revocations reach this process through revocation_store.sync
+        if revocation_store.is_revoked(payload.get("jti")) or revocation_store.issued_before_cutoff(user_id, payload.get("iat")):
             raise credentials_exception
-        # Attach the role from the database user to the payload for consistent access
-        payload["role"] = user.role
-        return user
+        principal = principal_cache.get(user_id)
+        if principal is None:
+            user = await db.get(models.User, user_id)
+            if user is None:
+                raise credentials_exception
+            # The role always comes from the database, never from the token
+            principal = Principal(user)
+            principal_cache.set(principal)
+        # A token must still match the user it was issued to
+        if principal.username != username:
+            raise credentials_exception
+        return principal
     except JWTError:
         raise credentials_exception
 
+def access_token_valid(token: str) -> bool:
+    """Whether a token that opened a long-lived stream is still unexpired and unrevoked.
+
+    Streams authenticate once, so they call this between messages; it stays in memory.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return not (revocation_store.is_revoked(payload.get("jti")) or revocation_store.issued_before_cutoff(payload.get("id"), payload.get("iat")))
+
 async def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
     print(f"Current user role in get_current_admin_user: {current_user.role}") # Temporary debug print
     if current_user.role != "admin":
@@ -70,17 +288,46 @@ async def get_current_admin_user(current_user: models.User = Depends(get_current
 @auth_router.post("/token", response_model=Token) # Use auth_router.post
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password):
+    if not user or not await password_pool.run(verify_password, form_data.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.role, "id": user.id}, expires_delta=access_token_expires
+    return issue_tokens(user)
+
+@auth_router.post("/token/refresh", response_model=Token)
+def refresh_access_token(request: RefreshRequest, db: Session = Depends(database.get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    try:
+        payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    if payload.get("type") != "refresh" or revocation_store.is_revoked(payload.get("jti")):
+        raise credentials_exception
+    # Refreshing reads the user again, so role changes and deletions take effect here
+    user = db.query(models.User).filter(models.User.id == payload.get("id")).first()
+    if user is None or user.username != payload.get("sub"):
+        raise credentials_exception
+    # Refresh tokens are single use; of two requests replaying one, only the first revokes it
+    if not revoke_token(db, payload):
+        raise credentials_exception
+    return issue_tokens(user)
+
+@auth_router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+def logout(request: LogoutRequest | None = None, token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db), current_user: models.User = Depends(get_current_user)):
+    revoke_token(db, jwt.get_unverified_claims(token))
+    if request is not None and request.refresh_token:
+        try:
+            payload = jwt.decode(request.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return
+        if payload.get("type") == "refresh" and payload.get("id") == current_user.id:
+            revoke_token(db, payload)
 
 @auth_router.get("/users/me/", response_model=schemas.User)
 async def read_users_me(current_user: models.User = Depends(get_current_user)):
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# e.g. redis://localhost:6379/0; unset keeps the cache in this process
+CACHE_URL = os.getenv("CACHE_URL")
+
+
+class MemoryBackend:
+    """LRU with per-entry expiry, local to this process."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, tags: tuple[str, ...]) -> list[int]:
+        with self._lock:
+            return [self._generations.get(tag, 0) for tag in tags]
+
+    def bump(self, tag: str):
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisBackend:
+    """Entries and tag generations in Redis, so every worker sees an invalidation at once."""
+
+    def __init__(self, url: str, prefix: str = "hackharbor:cache:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(self._prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._client.set(self._prefix + key, value, px=int(ttl * 1000))
+
+    def generations(self, tags: tuple[str, ...]) -> list[int]:
+        values = self._client.mget([f"{self._prefix}generation:{tag}" for tag in tags])
+        return [int(value or 0) for value in values]
+
+    def bump(self, tag: str):
+        self._client.incr(f"{self._prefix}generation:{tag}")
+
+    def size(self) -> int | None:
+        return None
+
+
+def _backend():
+    if CACHE_URL:
+        try:
+            return RedisBackend(CACHE_URL)
+        except ImportError:
+            print("CACHE_URL is set but the redis package is not installed; caching in process instead")
+    return MemoryBackend()
+
+
+def _if_none_match(request: Request) -> set[str]:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return set()
+    return {tag.strip() for tag in header.split(",")}
+
+
+def _validators(etag: str) -> dict:
+    # no-cache lets browsers keep the body but revalidate it on every use
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+class ResponseCache:
+    """Serialized responses for read endpoints whose data rarely changes.
+
+    Entries are keyed by route, role and query string, and carry tags such as
+    "machines". Invalidating a tag bumps its generation, which is part of every
+    key built with it, so stale entries are never read again and age out of
+    the LRU. Admin edits and first solves invalidate what they change; who is
+    playing can lag by up to CACHE_TTL seconds.
+
+    Responses carry an ETag hashed from the body and stored next to it, so a
+    304 always means the client holds exactly the bytes it would get, and
+    revalidating against a cached entry costs no query at all.
+    """
+
+    def __init__(self, backend=None, ttl: float = CACHE_TTL):
+        self.backend = backend if backend is not None else _backend()
+        self.ttl = ttl
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._errors = 0
+        self._not_modified = 0
+
+    def key(self, request: Request, role: str | None, tags: tuple[str, ...]) -> str | None:
+        try:
+            generations = self.backend.generations(tags)
+        except Exception as e:
+            self._failed(e)
+            return None
+        query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+        versions = ",".join(f"{tag}:{generation}" for tag, generation in zip(tags, generations))
+        return f"{request.url.path}|{role or 'anonymous'}|{query}|{versions}"
+
+    def etag(self, body: bytes) -> str:
+        return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+    def lookup(self, request: Request, role: str | None, tags: tuple[str, ...]) -> tuple[str | None, Response | None]:
+        """The cache key for this request, and a response to return as-is if one is ready.
+
+        A cached entry whose ETag matches If-None-Match gets a 304 without being sent again.
+        """
+        key = self.key(request, role, tags)
+        if key is None:
+            return None, None
+        try:
+            entry = self.backend.get(key)
+        except Exception as e:
+            self._failed(e)
+            return key, None
+        if entry is None:
+            self._misses += 1
+            return key, None
+        self._hits += 1
+        etag, body = entry.split(b"\n", 1)
+        return key, self._respond(request, etag.decode(), body)
+
+    def store(self, request: Request, key: str | None, body: bytes) -> Response:
+        etag = self.etag(body)
+        if key is not None:
+            try:
+                self.backend.set(key, etag.encode() + b"\n" + body, self.ttl)
+            except Exception as e:
+                self._failed(e)
+        return self._respond(request, etag, body)
+
+    def _respond(self, request: Request, etag: str, body: bytes) -> Response:
+        if etag in _if_none_match(request):
+            self._not_modified += 1
+            return Response(status_code=304, headers=_validators(etag))
+        return Response(content=body, media_type="application/json", headers=_validators(etag))
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            try:
+                self.backend.bump(tag)
+            except Exception as e:
+                self._failed(e)
+        self._invalidations += 1
+
+    def _failed(self, error: Exception):
+        # The cache is an optimisation; an unreachable backend only costs a database read
+        self._errors += 1
+        print(f"Response cache unavailable: {error}")
+
+    def metrics(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "ttl": self.ttl,
+            "entries": self.backend.size(),
+            "hits": self._hits,
+            "misses": self._misses,
+            "not_modified": self._not_modified,
+            "invalidations": self._invalidations,
+            "errors": self._errors,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,147 @@
+import os
+import re
+import threading
+import time
+
+import docker
+from sqlalchemy import or_
+
+import containers, database, models, scheduler
+from cache import response_cache
+from container_state import state_from_container
+from docker_manager import DEFAULT_DOCKER_HOST, DockerManager, docker_hosts
+
+DOCKER_EVENTS_RETRY_DELAY = float(os.getenv("DOCKER_EVENTS_RETRY_DELAY", "5"))
+
+MACHINE_NAME_RE = re.compile(r"^vuln-app-(\d+)$")
+CHALLENGE_NAME_RE = re.compile(r"^challenge-.*-(\d+)$")
+INSTANCE_NAME_RE = re.compile(r"^instance-(\d+)$")
+
+
+def _platform_ip(state: dict | None) -> str | None:
+    if state is None or state["status"] != "running":
+        return None
+    return state["networks"].get(containers.VULNVERSE_NETWORK_NAME)
+
+
+class DockerEventConsumer:
+    """Follows one daemon's event stream and mirrors container state into the DB.
+
+    Runs on its own thread because the Docker SDK's event stream is a blocking
+    generator. Machine, challenge and instance rows are matched to containers
+    by the names the lifecycle code gives them, and only if they were placed
+    on this consumer's host.
+    """
+
+    def __init__(self, manager: DockerManager, retry_delay: float = DOCKER_EVENTS_RETRY_DELAY):
+        self.manager = manager
+        self.state = manager.state
+        self.retry_delay = retry_delay
+        self._thread = None
+        self._stopping = threading.Event()
+        self._events = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"docker-events-{self.manager.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self.state.invalidate()
+        if self._events is not None:
+            self._events.close()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                client = self.manager.client
+                since = int(time.time())
+                self.state.replace([state_from_container(c) for c in client.containers.list(all=True)])
+                # Anything that happened during the snapshot is replayed from `since`.
+                self._events = client.events(since=since, decode=True, filters={"type": ["container", "network", "image"]})
+                for event in self._events:
+                    self.handle(event)
+            except Exception as e:
+                if not self._stopping.is_set():
+                    print(f"Docker event stream from {self.manager.name} interrupted: {e}")
+            self.state.invalidate()
+            self._stopping.wait(self.retry_delay)
+
+    def handle(self, event: dict):
+        self.manager.handle_event(event)
+        event_type = event.get("Type")
+        action = event.get("Action", "")
+        actor = event.get("Actor", {})
+
+        if event_type == "network" and action in ("connect", "disconnect"):
+            self._refresh(actor.get("Attributes", {}).get("container"))
+        elif event_type == "container":
+            container_id = actor.get("ID") or event.get("id")
+            if action.startswith("health_status"):
+                self.state.update(container_id, health=action.split(":", 1)[1].strip())
+            elif action in ("start", "unpause", "rename"):
+                self._refresh(container_id)
+            elif action in ("die", "pause"):
+                previous = self.state.update(container_id, status="exited" if action == "die" else "paused")
+                if previous is not None:
+                    self._sync_db(previous["name"], None, previous_ip=_platform_ip(previous), died=action == "die")
+            elif action == "destroy":
+                previous = self.state.remove(container_id)
+                if previous is not None:
+                    self._sync_db(previous["name"], None, previous_ip=_platform_ip(previous), died=False)
+
+    def _refresh(self, container_id: str | None):
+        if not container_id:
+            return
+        try:
+            container = self.manager.client.containers.get(container_id)
+        except docker.errors.NotFound:
+            self.state.remove(container_id)
+            return
+        state = state_from_container(container)
+        self.state.upsert(state)
+        ip_address = _platform_ip(state)
+        if ip_address is not None:
+            self._sync_db(state["name"], ip_address)
+
+    def _sync_db(self, name: str, ip_address: str | None, previous_ip: str | None = None, died: bool = False):
+        target = None
+        for pattern, model in ((MACHINE_NAME_RE, models.Machine), (CHALLENGE_NAME_RE, models.Challenge), (INSTANCE_NAME_RE, models.Instance)):
+            match = pattern.match(name)
+            if match:
+                target = (model, int(match.group(1)))
+                break
+        if target is None:
+            return
+
+        model, target_id = target
+        db = database.SessionLocal()
+        try:
+            query = db.query(model).filter(model.id == target_id, self._on_this_host(model))
+            if ip_address is not None:
+                query.update({model.ip_address: ip_address}, synchronize_session=False)
+            else:
+                # Only clear the IP we saw go away; a replacement may already be recorded.
+                query.filter(model.ip_address == previous_ip).update({model.ip_address: None}, synchronize_session=False)
+                if model is models.Instance and died:
+                    crashed = query.filter(model.status == "running").update(
+                        {model.status: "failed", model.error: "Container exited unexpectedly"}, synchronize_session=False
+                    )
+                    db.commit()
+                    if crashed:
+                        scheduler.scheduler.admit(db)
+            db.commit()
+            response_cache.invalidate(model.__tablename__)
+        finally:
+            db.close()
+
+
+    def _on_this_host(self, model):
+        if self.manager.name == DEFAULT_DOCKER_HOST:
+            # Rows without a host predate multi-host support and belong to the default daemon.
+            return or_(model.host == self.manager.name, model.host.is_(None))
+        return model.host == self.manager.name
+
+
+docker_event_consumers = [DockerEventConsumer(manager) for manager in docker_hosts.values()]
@@ -0,0 +1,96 @@
+import threading
+
+
+def state_from_container(container) -> dict:
+    attrs = container.attrs
+    state = attrs.get("State", {})
+    networks = attrs.get("NetworkSettings", {}).get("Networks") or {}
+    return {
+        "id": container.id,
+        "name": container.name,
+        "image": attrs.get("Config", {}).get("Image"),
+        "status": state.get("Status", container.status),
+        "health": (state.get("Health") or {}).get("Status"),
+        "networks": {name: network.get("IPAddress") or None for name, network in networks.items()},
+    }
+
+
+class ContainerStateView:
+    """In-memory picture of one daemon's containers, kept current by Docker events.
+
+    Each entry is a dict with id, name, image, status, health and networks
+    (network name -> IP). `synced` is False until the first snapshot has been
+    taken and whenever the event stream drops, so callers fall back to asking
+    the daemon directly.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._id_by_name = {}
+        self._lock = threading.Lock()
+        self.synced = False
+
+    def replace(self, states: list[dict]):
+        with self._lock:
+            self._by_id = {state["id"]: state for state in states}
+            self._id_by_name = {state["name"]: state["id"] for state in states}
+            self.synced = True
+
+    def upsert(self, state: dict) -> dict | None:
+        with self._lock:
+            previous = self._by_id.get(state["id"])
+            if previous is not None and self._id_by_name.get(previous["name"]) == state["id"]:
+                del self._id_by_name[previous["name"]]
+            if previous is not None and "health" not in state:
+                state["health"] = previous.get("health")
+            self._by_id[state["id"]] = state
+            self._id_by_name[state["name"]] = state["id"]
+            return previous
+
+    def update(self, container_id: str, **fields) -> dict | None:
+        with self._lock:
+            state = self._by_id.get(container_id)
+            if state is None:
+                return None
+            previous = dict(state)
+            state.update(fields)
+            return previous
+
+    def rename(self, container_id: str, name: str):
+        with self._lock:
+            state = self._by_id.get(container_id)
+            if state is None:
+                return
+            if self._id_by_name.get(state["name"]) == container_id:
+                del self._id_by_name[state["name"]]
+            state["name"] = name
+            self._id_by_name[name] = container_id
+
+    def remove(self, container_id: str) -> dict | None:
+        with self._lock:
+            state = self._by_id.pop(container_id, None)
+            if state is not None and self._id_by_name.get(state["name"]) == container_id:
+                del self._id_by_name[state["name"]]
+            return state
+
+    def get(self, name: str) -> dict | None:
+        with self._lock:
+            container_id = self._id_by_name.get(name)
+            state = self._by_id.get(container_id) if container_id else None
+            return dict(state) if state else None
+
+    def get_by_id(self, container_id: str) -> dict | None:
+        with self._lock:
+            state = self._by_id.get(container_id)
+            return dict(state) if state else None
+
+    def known_absent(self, name_or_id: str) -> bool:
+        with self._lock:
+            return self.synced and name_or_id not in self._id_by_name and name_or_id not in self._by_id
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [dict(state) for state in self._by_id.values()]
+
+    def invalidate(self):
+        self.synced = False
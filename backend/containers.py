@@ -0,0 +1,176 @@
+import docker
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import resources, schemas
+from container_state import state_from_container
+from docker_manager import docker_hosts, for_host
+
+VULNVERSE_NETWORK_NAME = os.getenv("DOCKER_NETWORK_NAME", "vulnverse_network")
+CONTAINER_STOP_TIMEOUT = resources.CONTAINER_STOP_TIMEOUT
+TEARDOWN_WORKERS = int(os.getenv("TEARDOWN_WORKERS", "8"))
+TEARDOWN_NAME_PREFIX = "teardown-"
+
+_teardown_executor = ThreadPoolExecutor(max_workers=TEARDOWN_WORKERS, thread_name_prefix="teardown")
+
+
+class ContainerError(Exception):
+    """Raised when a container lifecycle operation cannot be completed."""
+
+    def __init__(self, detail: str, status_code: int = 500):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def _manager(host: str | None):
+    try:
+        return for_host(host)
+    except LookupError as e:
+        raise ContainerError(str(e))
+
+
+def machine_container_name(machine_id: int) -> str:
+    return f"vuln-app-{machine_id}"
+
+
+def challenge_container_name(challenge) -> str:
+    return f"challenge-{challenge.title.replace(' ', '-').lower()}-{challenge.id}"
+
+
+def _create_docker_network(client):
+    ipam_pool = docker.types.IPAMPool(subnet='172.20.0.0/16', gateway='172.20.0.1')
+    ipam_config = docker.types.IPAMConfig(pool_configs=[ipam_pool])
+    return client.networks.create(VULNVERSE_NETWORK_NAME, driver="bridge", ipam=ipam_config)
+
+
+def get_or_create_docker_network(host: str | None = None):
+    return _manager(host).get_network(VULNVERSE_NETWORK_NAME, create=_create_docker_network)
+
+
+def stop_timeout_from_config(config_json: str | None) -> int:
+    """Grace period before SIGKILL, from a machine's config_json `stop_timeout`."""
+    return resources.profile_from_config(config_json).stop_timeout
+
+
+def _stop_and_remove(manager, container, stop_timeout: int):
+    try:
+        # SIGTERM, then SIGKILL once the grace period runs out
+        container.stop(timeout=stop_timeout)
+    except docker.errors.NotFound:
+        manager.state.remove(container.id)
+        return
+    except docker.errors.APIError:
+        pass
+    try:
+        container.remove(force=True)
+    except docker.errors.NotFound:
+        pass
+    manager.state.remove(container.id)
+
+
+def _remove_from_daemon(manager, container_name: str, stop_timeout: int = CONTAINER_STOP_TIMEOUT):
+    try:
+        container = manager.client.containers.get(container_name)
+    except docker.errors.NotFound:
+        return
+    _stop_and_remove(manager, container, stop_timeout)
+
+
+def remove_container(container_name: str, stop_timeout: int = CONTAINER_STOP_TIMEOUT, host: str | None = None):
+    manager = _manager(host)
+    # The event-fed view already knows the container is gone; skip the socket round-trips.
+    if manager.state.known_absent(container_name):
+        return
+    _remove_from_daemon(manager, container_name, stop_timeout)
+
+
+def teardown_container(container_name: str, stop_timeout: int = CONTAINER_STOP_TIMEOUT, host: str | None = None):
+    """Free `container_name` immediately and stop the old container in the background.
+
+    The container is renamed out of the way first, so a replacement with the
+    same name can start while the old one is still inside its grace period.
+    """
+    manager = _manager(host)
+    if manager.state.known_absent(container_name):
+        return
+    try:
+        container = manager.client.containers.get(container_name)
+    except docker.errors.NotFound:
+        return
+    retired_name = f"{TEARDOWN_NAME_PREFIX}{uuid.uuid4().hex[:12]}-{container_name}"
+    try:
+        container.rename(retired_name)
+    except docker.errors.APIError:
+        # Could not move it aside; stop it here so the name is free for a replacement.
+        _stop_and_remove(manager, container, stop_timeout)
+        return
+    manager.state.rename(container.id, retired_name)
+    _teardown_executor.submit(_stop_and_remove, manager, container, stop_timeout)
+
+
+def cleanup_teardowns():
+    """Remove containers whose background teardown died with a previous process."""
+    for manager in docker_hosts.values():
+        try:
+            leftovers = manager.client.containers.list(all=True, filters={"name": TEARDOWN_NAME_PREFIX})
+        except docker.errors.DockerException:
+            continue
+        for container in leftovers:
+            if container.name.startswith(TEARDOWN_NAME_PREFIX):
+                _teardown_executor.submit(_stop_and_remove, manager, container, 0)
+
+
+def run_container(image_name: str, container_name: str, publish_ports: bool = True, labels: dict | None = None, profile: schemas.ResourceProfile | None = None, host: str | None = None) -> str:
+    """Start a fresh container on the platform network of `host` and return its IP address.
+
+    The container is capped by `profile`, or by the platform defaults if none is given.
+    """
+    manager = _manager(host)
+    client = manager.client
+    network = get_or_create_docker_network(host)
+
+    # Move any old container out of the way; it is stopped in the background
+    teardown_container(container_name, host=host)
+
+    try:
+        exposed_ports = manager.get_exposed_ports(image_name)
+    except docker.errors.ImageNotFound:
+        # Placement prefers hosts that already have the image, but any host may have to fetch it.
+        try:
+            client.images.pull(image_name)
+            exposed_ports = manager.get_exposed_ports(image_name)
+        except docker.errors.APIError:
+            raise ContainerError(f"Docker image {image_name} not found on {manager.name}.", status_code=404)
+
+    run_kwargs = resources.docker_options(resources.resolve(profile))
+    if publish_ports:
+        run_kwargs["ports"] = {port: None for port in exposed_ports}
+
+    def run():
+        return client.containers.run(
+            image_name,
+            name=container_name,
+            detach=True,
+            network=network.name,
+            labels=labels or {},
+            **run_kwargs
+        )
+
+    try:
+        container = run()
+    except docker.errors.NotFound:
+        # The cached network or image may have been removed behind our back.
+        manager.invalidate_network(VULNVERSE_NETWORK_NAME)
+        manager.invalidate_image(image_name)
+        raise
+    except docker.errors.APIError as e:
+        if e.status_code != 409:
+            raise
+        # Name still taken by a container the state view had not seen yet
+        _remove_from_daemon(manager, container_name)
+        container = run()
+    container.reload()
+    manager.state.upsert(state_from_container(container))
+    return container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
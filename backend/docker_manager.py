@@ -0,0 +1,150 @@
+import docker
+import os
+import threading
+import time
+
+import requests
+
+from container_state import ContainerStateView
+
+# Named daemons, e.g. "local=unix:///var/run/docker.sock,edge-1=tcp://10.0.0.12:2375".
+# Left empty, there is a single "local" host configured from DOCKER_HOST and friends.
+DOCKER_HOSTS = os.getenv("DOCKER_HOSTS", "")
+DOCKER_MAX_POOL_SIZE = int(os.getenv("DOCKER_MAX_POOL_SIZE", "16"))
+DOCKER_CLIENT_TIMEOUT = int(os.getenv("DOCKER_CLIENT_TIMEOUT", "60"))
+DOCKER_METADATA_TTL = float(os.getenv("DOCKER_METADATA_TTL", "300"))
+
+
+class TTLCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+class DockerManager:
+    """Docker client for one daemon, with cached network and image metadata.
+
+    The client keeps a pool of keep-alive connections to the daemon, so it is
+    created once per host and shared by every request and orchestrator worker.
+    `state` is the event-fed view of that daemon's containers.
+    """
+
+    def __init__(self, name: str = "local", base_url: str | None = None, max_pool_size: int = DOCKER_MAX_POOL_SIZE, ttl: float = DOCKER_METADATA_TTL):
+        self.name = name
+        self.base_url = base_url
+        self.max_pool_size = max_pool_size
+        self.state = ContainerStateView()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._networks = TTLCache(ttl)
+        self._images = TTLCache(ttl)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None and self.base_url:
+                    self._client = docker.DockerClient(base_url=self.base_url, max_pool_size=self.max_pool_size, timeout=DOCKER_CLIENT_TIMEOUT)
+                elif self._client is None:
+                    self._client = docker.from_env(max_pool_size=self.max_pool_size, timeout=DOCKER_CLIENT_TIMEOUT)
+        return self._client
+
+    def get_network(self, name: str, create=None):
+        network = self._networks.get(name)
+        if network is not None:
+            return network
+        try:
+            network = self.client.networks.get(name)
+        except docker.errors.NotFound:
+            if create is None:
+                raise
+            network = create(self.client)
+        self._networks.set(name, network)
+        return network
+
+    def get_exposed_ports(self, image_name: str) -> list[str]:
+        """Return the image's exposed ports; raises docker.errors.ImageNotFound."""
+        ports = self._images.get(image_name)
+        if ports is not None:
+            return ports
+        image = self.client.images.get(image_name)
+        ports = list(image.attrs['Config'].get('ExposedPorts', None) or {})
+        self._images.set(image_name, ports)
+        return ports
+
+    def has_image(self, image_name: str) -> bool:
+        try:
+            self.get_exposed_ports(image_name)
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            return False
+        return True
+
+    def host_resources(self) -> dict | None:
+        """CPUs and memory the daemon reports for its host, or None if it is unreachable."""
+        try:
+            info = self.client.info()
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            return None
+        return {"cpu": info.get("NCPU"), "memory_mb": (info.get("MemTotal") or 0) // (1024 * 1024)}
+
+    def invalidate_network(self, name: str | None = None):
+        self._networks.invalidate(name)
+
+    def invalidate_image(self, image_name: str | None = None):
+        self._images.invalidate(image_name)
+
+    def handle_event(self, event: dict):
+        """Drop cached metadata made stale by a Docker daemon event."""
+        event_type = event.get("Type")
+        action = event.get("Action", "")
+        attributes = event.get("Actor", {}).get("Attributes", {})
+        if event_type == "network" and action in ("destroy", "remove"):
+            self.invalidate_network(attributes.get("name"))
+        elif event_type == "image" and action in ("delete", "untag", "tag", "pull", "import", "load"):
+            # Image events are keyed by id or by a tag we may not have cached, so start fresh.
+            self.invalidate_image()
+
+
+def _parse_hosts(spec: str) -> dict:
+    hosts = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, base_url = item.split("=", 1)
+        hosts[name.strip()] = base_url.strip()
+    return hosts
+
+
+docker_hosts = {name: DockerManager(name, base_url) for name, base_url in _parse_hosts(DOCKER_HOSTS).items()} or {"local": DockerManager()}
+# Rows written before multi-host support have no host recorded; they live here.
+DEFAULT_DOCKER_HOST = next(iter(docker_hosts))
+
+
+def for_host(name: str | None) -> DockerManager:
+    manager = docker_hosts.get(name or DEFAULT_DOCKER_HOST)
+    if manager is None:
+        raise LookupError(f"Docker host {name} is not configured")
+    return manager
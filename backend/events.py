@@ -0,0 +1,116 @@
+import asyncio
+import itertools
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_KEEPALIVE_INTERVAL = float(os.getenv("EVENT_KEEPALIVE_INTERVAL", "15"))
+
+# Public events go to every subscriber; "job" events only reach the user who submitted the job.
+EVENT_TYPES = ("solve", "first_blood", "machine", "challenge", "announcement", "job")
+
+
+def parse_types(spec: str | None) -> set:
+    if not spec:
+        return set(EVENT_TYPES)
+    return {event_type for event_type in (part.strip() for part in spec.split(",")) if event_type in EVENT_TYPES}
+
+
+class Subscription:
+    """One connected client's queue of pending events.
+
+    The queue is bounded: when a client reads slower than events arrive, the
+    oldest pending events are dropped and the client is sent a "lagged" event
+    with the count, so it can refetch over REST instead of holding memory.
+    """
+
+    def __init__(self, user_id: int, types: set, max_queue: int = EVENT_QUEUE_SIZE):
+        self.user_id = user_id
+        self.types = types
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=max_queue)
+
+    def offer(self, event: dict):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(event)
+
+    async def next(self, timeout: float = EVENT_KEEPALIVE_INTERVAL) -> dict | None:
+        """The next event, or None after `timeout` seconds so the caller can send a keepalive."""
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return {"id": None, "type": "lagged", "data": {"dropped": dropped}}
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """Fans events published by handlers and jobs out to WebSocket/SSE subscribers.
+
+    Subscriptions live on the event loop; `publish` may be called from the
+    threadpool and hands delivery over to the loop thread.
+    """
+
+    def __init__(self, max_queue: int = EVENT_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self._subscriptions = set()
+        self._sequence = itertools.count(1)
+        self._loop = None
+        self._published = 0
+        self._dropped = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def publish(self, event_type: str, data: dict, user_id: int | None = None):
+        if self._loop is None:
+            return
+        event = {
+            "id": next(self._sequence),
+            "type": event_type,
+            "data": data,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(event, user_id)
+        else:
+            self._loop.call_soon_threadsafe(self._deliver, event, user_id)
+
+    def _deliver(self, event: dict, user_id: int | None):
+        self._published += 1
+        for subscription in list(self._subscriptions):
+            if event["type"] not in subscription.types:
+                continue
+            if user_id is not None and subscription.user_id != user_id:
+                continue
+            dropped = subscription.dropped
+            subscription.offer(event)
+            self._dropped += subscription.dropped - dropped
+
+    @contextmanager
+    def subscribe(self, user_id: int, types: set):
+        subscription = Subscription(user_id, types, self.max_queue)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self._subscriptions),
+            "published": self._published,
+            "dropped": self._dropped,
+            "max_queue": self.max_queue,
+        }
+
+
+event_hub = EventHub()
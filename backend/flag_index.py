@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+import database, models
+
+FLAG_INDEX_RELOAD_INTERVAL = float(os.getenv("FLAG_INDEX_RELOAD_INTERVAL", "30"))
+
+
+class FlagIndex:
+    """Digests of every active flag, keyed by machine or challenge.
+
+    Submissions are checked against this index without touching the database.
+    Digests are keyed with a per-process secret, so how long a lookup takes says
+    nothing about how close a guess was to a real flag, and plaintext flags are
+    not kept in memory. Admin edits rebuild the affected target right away;
+    edits made through other workers arrive with the periodic reload.
+    """
+
+    def __init__(self, interval: float = FLAG_INDEX_RELOAD_INTERVAL):
+        self.interval = interval
+        self._key = secrets.token_bytes(32)
+        self._targets = {"machine": {}, "challenge": {}}
+        self._lock = threading.Lock()
+        # Targets rebuilt while a reload is reading; their newer entries survive the swap
+        self._touched = None
+        self._task = None
+
+    def _digest(self, flag: str) -> bytes:
+        return hashlib.blake2b(flag.encode(), key=self._key, digest_size=32).digest()
+
+    def verify(self, target_type: str, target_id: int, flag: str) -> int | None:
+        """The id of the active flag `flag` matches on the target, or None."""
+        digest = self._digest(flag)
+        with self._lock:
+            flags = self._targets[target_type].get(target_id)
+            match = flags.get(digest) if flags else None
+        if match is None:
+            return None
+        stored_digest, flag_id = match
+        return flag_id if hmac.compare_digest(stored_digest, digest) else None
+
+    def load_machine(self, db: Session, machine_id: int):
+        rows = db.query(models.Flag.id, models.Flag.flag).filter(
+            models.Flag.machine_id == machine_id,
+            or_(models.Flag.is_deleted == False, models.Flag.is_deleted.is_(None))
+        ).all()
+        self._set("machine", machine_id, rows)
+
+    def load_challenge(self, db: Session, challenge_id: int):
+        rows = db.query(models.ChallengeFlag.id, models.ChallengeFlag.flag).filter(
+            models.ChallengeFlag.challenge_id == challenge_id,
+            or_(models.ChallengeFlag.is_deleted == False, models.ChallengeFlag.is_deleted.is_(None))
+        ).all()
+        self._set("challenge", challenge_id, rows)
+
+    def _set(self, target_type: str, target_id: int, rows):
+        flags = self._build(rows)
+        with self._lock:
+            if flags:
+                self._targets[target_type][target_id] = flags
+            else:
+                self._targets[target_type].pop(target_id, None)
+            if self._touched is not None:
+                self._touched.add((target_type, target_id))
+
+    def _build(self, rows) -> dict:
+        flags = {}
+        for flag_id, flag in rows:
+            if flag is None:
+                continue
+            digest = self._digest(flag)
+            flags[digest] = (digest, flag_id)
+        return flags
+
+    def reload(self):
+        with self._lock:
+            self._touched = set()
+        db = database.SessionLocal()
+        try:
+            targets = {"machine": {}, "challenge": {}}
+            machine_rows = db.query(models.Flag.machine_id, models.Flag.id, models.Flag.flag).filter(
+                or_(models.Flag.is_deleted == False, models.Flag.is_deleted.is_(None))
+            ).all()
+            challenge_rows = db.query(models.ChallengeFlag.challenge_id, models.ChallengeFlag.id, models.ChallengeFlag.flag).filter(
+                or_(models.ChallengeFlag.is_deleted == False, models.ChallengeFlag.is_deleted.is_(None))
+            ).all()
+        finally:
+            db.close()
+        for target_type, rows in (("machine", machine_rows), ("challenge", challenge_rows)):
+            grouped = {}
+            for target_id, flag_id, flag in rows:
+                grouped.setdefault(target_id, []).append((flag_id, flag))
+            targets[target_type] = {target_id: self._build(flags) for target_id, flags in grouped.items()}
+        with self._lock:
+            for target_type, target_id in self._touched:
+                current = self._targets[target_type].get(target_id)
+                if current:
+                    targets[target_type][target_id] = current
+                else:
+                    targets[target_type].pop(target_id, None)
+            self._targets = targets
+            self._touched = None
+
+    def size(self) -> dict:
+        with self._lock:
+            return {target_type: sum(len(flags) for flags in targets.values()) for target_type, targets in self._targets.items()}
+
+    async def start(self):
+        await asyncio.to_thread(self.reload)
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                print(f"Flag index reload failed: {e}")
+
+
+flag_index = FlagIndex()
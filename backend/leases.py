@@ -0,0 +1,106 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.orm import Session
+
+import database, models
+from orchestrator import orchestrator
+
+LEASE_REAPER_INTERVAL = float(os.getenv("LEASE_REAPER_INTERVAL", "30"))
+LEASE_REAPER_BATCH_SIZE = int(os.getenv("LEASE_REAPER_BATCH_SIZE", "200"))
+
+
+def _extend(db: Session, table, target_column: str, target_id: int, user_id: int) -> datetime | None:
+    expires_at = models.lease_expiry()
+    result = db.execute(
+        update(table)
+        .where(table.c.user_id == user_id, table.c[target_column] == target_id)
+        .values(expires_at=expires_at)
+    )
+    db.commit()
+    return expires_at if result.rowcount else None
+
+
+def extend_machine_lease(db: Session, machine_id: int, user_id: int) -> datetime | None:
+    return _extend(db, models.active_machines_association, "machine_id", machine_id, user_id)
+
+
+def extend_challenge_lease(db: Session, challenge_id: int, user_id: int) -> datetime | None:
+    return _extend(db, models.active_challenges_association, "challenge_id", challenge_id, user_id)
+
+
+class LeaseReaper:
+    """Periodically drops expired leases and tears down containers nobody holds any more.
+
+    Expired rows are found through the index on expires_at, so a sweep never
+    scans the whole table. Teardown goes through the orchestrator, which
+    serializes it with any start running for the same target.
+    """
+
+    def __init__(self, interval: float = LEASE_REAPER_INTERVAL, batch_size: int = LEASE_REAPER_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Lease reaper sweep failed: {e}")
+
+    def _expire(self, db: Session, table, target_column: str, now: datetime) -> set:
+        rows = db.execute(
+            select(table.c.user_id, table.c[target_column])
+            .where(table.c.expires_at <= now)
+            .order_by(table.c.expires_at)
+            .limit(self.batch_size)
+        ).all()
+        if rows:
+            db.execute(delete(table).where(tuple_(table.c.user_id, table.c[target_column]).in_([tuple(row) for row in rows])))
+        return {target_id for _, target_id in rows}
+
+    def sweep(self) -> dict:
+        db = database.SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            machine_ids = self._expire(db, models.active_machines_association, "machine_id", now)
+            challenge_ids = self._expire(db, models.active_challenges_association, "challenge_id", now)
+
+            expired_instances = [
+                instance_id for (instance_id,) in db.query(models.Instance.id).filter(
+                    models.Instance.status == "running",
+                    models.Instance.expires_at <= now
+                ).order_by(models.Instance.expires_at).limit(self.batch_size).all()
+            ]
+            if expired_instances:
+                db.query(models.Instance).filter(models.Instance.id.in_(expired_instances)).update(
+                    {models.Instance.status: "stopping"}, synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+        # The reap jobs stop a shared container only if no other lease is left on it.
+        for machine_id in machine_ids:
+            orchestrator.submit("reap", "machine", machine_id)
+        for challenge_id in challenge_ids:
+            orchestrator.submit("reap", "challenge", challenge_id)
+        for instance_id in expired_instances:
+            orchestrator.submit("stop", "instance", instance_id)
+        return {"machines": sorted(machine_ids), "challenges": sorted(challenge_ids), "instances": expired_instances}
+
+
+lease_reaper = LeaseReaper()
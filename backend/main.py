@@ -1,9 +1,16 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, Request, WebSocket, WebSocketDisconnect
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, selectinload
-import models, database, auth, schemas, docker
+from pydantic import TypeAdapter
+import models, database, auth, schemas, containers, orchestrator, warm_pool, scheduler, leases, container_events, resources, placement, revocation, scoreboard, events, analytics, rollups
+from cache import response_cache
+from flag_index import flag_index
+from docker_manager import docker_hosts
 from sqlalchemy.sql import func
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import json 
 import subprocess
 import os
@@ -27,17 +34,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-VULNVERSE_NETWORK_NAME = os.getenv("DOCKER_NETWORK_NAME", "vulnverse_network")
-
-def get_or_create_docker_network():
-    client = docker.from_env()
+@app.on_event("startup")
+async def start_background_services():
+    await events.event_hub.start()
+    for consumer in container_events.docker_event_consumers:
+        consumer.start()
+    await orchestrator.orchestrator.start()
+    await warm_pool.warm_pool.start()
+    await asyncio.to_thread(_resume_scheduler)
+    await asyncio.to_thread(containers.cleanup_teardowns)
+    await leases.lease_reaper.start()
+    await revocation.revocation_store.start()
+    await scoreboard.rank_index.start()
+    await flag_index.start()
+    await rollups.rollup_aggregator.start()
+
+def _resume_scheduler():
+    db = database.SessionLocal()
     try:
-        network = client.networks.get(VULNVERSE_NETWORK_NAME)
-    except docker.errors.NotFound:
-        ipam_pool = docker.types.IPAMPool(subnet='172.20.0.0/16', gateway='172.20.0.1')
-        ipam_config = docker.types.IPAMConfig(pool_configs=[ipam_pool])
-        network = client.networks.create(VULNVERSE_NETWORK_NAME, driver="bridge", ipam=ipam_config)
-    return network
+        scheduler.scheduler.resume(db)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    await rollups.rollup_aggregator.stop()
+    await flag_index.stop()
+    await scoreboard.rank_index.stop()
+    await revocation.revocation_store.stop()
+    await leases.lease_reaper.stop()
+    await warm_pool.warm_pool.stop()
+    await orchestrator.orchestrator.stop()
+    for consumer in container_events.docker_event_consumers:
+        consumer.stop()
+    await database.async_engine.dispose()
+
+def _publish_solve(current_user: models.User, target_type: str, target_id: int, target_name: str, score: int, first_blood: bool):
+    entry = scoreboard.rank_index.entry(current_user.id)
+    solve = {
+        "user_id": current_user.id,
+        "username": current_user.username,
+        "target_type": target_type,
+        "target_id": target_id,
+        "target_name": target_name,
+        "score": score,
+        "rank": entry["rank"] if entry else None,
+    }
+    events.event_hub.publish("solve", solve)
+    if first_blood:
+        events.event_hub.publish("first_blood", solve)
+
+def _publish_machine(action: str, db_machine: models.Machine):
+    events.event_hub.publish("machine", {"action": action, "machine_id": db_machine.id, "name": db_machine.name, "status": db_machine.status})
+
+def _publish_challenge(action: str, db_challenge: models.Challenge):
+    events.event_hub.publish("challenge", {"action": action, "challenge_id": db_challenge.id, "title": db_challenge.title})
+
+# Responses served from response_cache are serialized the way response_model would
+_machine = TypeAdapter(schemas.Machine)
+_machine_summaries = TypeAdapter(list[schemas.MachineSummary])
+_challenge = TypeAdapter(schemas.Challenge)
+_challenge_summaries = TypeAdapter(list[schemas.ChallengeSummary])
+_changelog_list = TypeAdapter(list[schemas.Changelog])
+
+
+def _dump(adapter: TypeAdapter, value) -> bytes:
+    # Validate first so ORM objects are read through the schema, lazy loads included
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
 
 @app.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
@@ -48,7 +111,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
         raise HTTPException(status_code=400, detail="Username already registered")
     
     print("--- User does not exist, proceeding to hash password ---")
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = auth.password_pool.run_sync(auth.get_password_hash, user.password)
     print("--- Password hashed successfully ---")
     
     db_user = models.User(username=user.username, email=user.email, password=hashed_password, role=user.role)
@@ -58,40 +121,55 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
     db.commit()
     print("--- User committed, refreshing instance ---")
     db.refresh(db_user)
+    response_cache.invalidate("users")
     print("--- Returning created user ---")
     return db_user
 
 
 
-@app.get("/machines/", response_model=list[schemas.Machine])
-def read_machines(skip: int = 0, limit: int = 100, search: str | None = None, show_deleted: bool = False, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    query = db.query(models.Machine)
+@app.get("/machines/", response_model=list[schemas.MachineSummary])
+async def read_machines(request: Request, skip: int = 0, limit: int = 100, search: str | None = None, show_deleted: bool = False, db: AsyncSession = Depends(database.get_async_read_db), current_user: models.User = Depends(auth.get_current_user)):
+    cache_key, cached = response_cache.lookup(request, current_user.role, ("machines",))
+    if cached is not None:
+        return cached
+
+    query = select(models.Machine).options(models.active_user_count(models.Machine))
     if current_user.role == "admin":
         if not show_deleted:
-            query = query.filter(models.Machine.is_deleted == False)
+            query = query.where(models.Machine.is_deleted == False)
     else:
         # For non-admins, filter out upcoming and deleted machines
-        query = query.filter(
+        query = query.where(
             models.Machine.is_deleted == False,
             models.Machine.status != "upcoming"
         )
 
     if search:
-        query = query.filter(models.Machine.name.ilike(f"%{search}%"))
-    machines = query.offset(skip).limit(limit).all()
-    return machines
+        query = query.where(models.Machine.name.ilike(f"%{search}%"))
+    machines = (await db.scalars(query.offset(skip).limit(limit))).all()
+    return response_cache.store(request, cache_key, _dump(_machine_summaries, machines))
 
-@app.get("/machines/upcoming", response_model=list[schemas.Machine])
-def read_upcoming_machines(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    machines = db.query(models.Machine).filter(models.Machine.status == "upcoming").offset(skip).limit(limit).all()
-    return machines
+@app.get("/machines/upcoming", response_model=list[schemas.MachineSummary])
+async def read_upcoming_machines(request: Request, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_async_db)):
+    cache_key, cached = response_cache.lookup(request, None, ("machines",))
+    if cached is not None:
+        return cached
+
+    machines = (await db.scalars(
+        select(models.Machine).options(models.active_user_count(models.Machine)).where(models.Machine.status == "upcoming").offset(skip).limit(limit)
+    )).all()
+    return response_cache.store(request, cache_key, _dump(_machine_summaries, machines))
 
 @app.get("/machines/{machine_id}", response_model=schemas.Machine)
-def read_machine(machine_id: int, db: Session = Depends(database.get_db)):
-    db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
+def read_machine(machine_id: int, request: Request, db: Session = Depends(database.get_db)):
+    cache_key, cached = response_cache.lookup(request, None, ("machines",))
+    if cached is not None:
+        return cached
+
+    db_machine = db.query(models.Machine).options(selectinload(models.Machine.flags), selectinload(models.Machine.active_users)).filter(models.Machine.id == machine_id).first()
     if db_machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
-    return db_machine
+    return response_cache.store(request, cache_key, _dump(_machine, db_machine))
 
 @app.post("/machines/", response_model=schemas.Machine)
 def create_machine(machine: schemas.MachineCreate, db: Session = Depends(database.get_db)):
@@ -99,6 +177,7 @@ def create_machine(machine: schemas.MachineCreate, db: Session = Depends(databas
     db.add(db_machine)
     db.commit()
     db.refresh(db_machine)
+    response_cache.invalidate("machines")
     return db_machine
 
 @app.post("/admin/machines/", response_model=schemas.Machine)
@@ -125,6 +204,9 @@ def create_admin_machine(machine: schemas.MachineCreate, db: Session = Depends(d
         db.add(db_flag)
     db.commit()
     db.refresh(db_machine)
+    flag_index.load_machine(db, db_machine.id)
+    response_cache.invalidate("machines")
+    _publish_machine("created", db_machine)
     return db_machine
 
 @app.post("/flags/", response_model=schemas.Flag)
@@ -133,162 +215,223 @@ def create_flag(flag: schemas.FlagCreate, db: Session = Depends(database.get_db)
     db.add(db_flag)
     db.commit()
     db.refresh(db_flag)
+    flag_index.load_machine(db, db_flag.machine_id)
+    response_cache.invalidate("machines")
     return db_flag
 
 
 
-@app.post("/machines/{machine_id}/start")
-def start_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def _submit_machine_job(action: str, machine_id: int, db: Session, current_user: models.User):
     db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
     if not db_machine:
         raise HTTPException(status_code=404, detail="Machine not found")
-
-    ip_address = db_machine.ip_address
-    
-    # --- Start machine 
-    if ip_address is None:
-        try:
-            client = docker.from_env()
-            network = get_or_create_docker_network()
-            container_name = f"vuln-app-{db_machine.id}"
-
-            try:
-                # Clean up old container if it exists
-                container = client.containers.get(container_name)
-                container.stop()
-                container.remove()
-            except docker.errors.NotFound:
-                pass 
-
-            #  detect ports 
-            try:
-                image = client.images.get(db_machine.source_identifier)
-                exposed_ports = image.attrs['Config'].get('ExposedPorts', {})
-                ports_to_publish = {port: None for port in exposed_ports.keys()}
-            except docker.errors.ImageNotFound:
-                raise HTTPException(status_code=404, detail=f"Docker image {db_machine.source_identifier} not found.")
-
-            container = client.containers.run(
-                db_machine.source_identifier,
-                name=container_name,
-                detach=True,
-                network=network.name,
-                ports=ports_to_publish
-            )
-            container.reload()
-            ip_address = container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
-
-            # Update the database with the new IP address
-            db_machine.ip_address = ip_address
-            db.add(db_machine)
-            # ip avalable
-            db.commit()
-
-        except Exception as e:
-           
-            db_machine.ip_address = None
-            db.commit()
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred while starting the machine: {e}")
-
-    # Adding the current user to the list of active users
-    if current_user not in db_machine.active_users:
-        db_machine.active_users.append(current_user)
-        db.commit()
-        db.refresh(db_machine)
-
-    return {"message": f"Machine {db_machine.name} is active for you with IP {ip_address}"}
-
-@app.post("/machines/{machine_id}/stop")
-def stop_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
+    return orchestrator.orchestrator.submit(action, "machine", db_machine.id, user_id=current_user.id)
+
+# The shared container serves every player on the machine and bypasses the scheduler,
+# so only admins drive it; players get their own through /machines/{id}/instance.
+@app.post("/machines/{machine_id}/start", response_model=schemas.Job, status_code=202)
+def start_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    return _submit_machine_job("start", machine_id, db, current_user)
+
+@app.post("/machines/{machine_id}/stop", response_model=schemas.Job, status_code=202)
+def stop_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    return _submit_machine_job("stop", machine_id, db, current_user)
+
+@app.post("/machines/{machine_id}/restart", response_model=schemas.Job, status_code=202)
+def restart_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    return _submit_machine_job("restart", machine_id, db, current_user)
+
+def _instance_response(db: Session, instance: models.Instance):
+    instance.queue_position = scheduler.scheduler.queue_position(db, instance)
+    return instance
+
+def _get_user_instance(instance_id: int, db: Session, current_user: models.User):
+    instance = db.query(models.Instance).filter(models.Instance.id == instance_id).first()
+    if instance is None or (instance.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Instance not found")
+    return instance
+
+@app.post("/machines/{machine_id}/instance", response_model=schemas.Instance, status_code=202)
+def request_machine_instance(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id, models.Machine.is_deleted == False).first()
     if not db_machine:
         raise HTTPException(status_code=404, detail="Machine not found")
+    instance = scheduler.scheduler.request_instance(db, current_user, machine=db_machine)
+    return _instance_response(db, instance)
 
-    #Removeing the current user 
-    if current_user in db_machine.active_users:
-        db_machine.active_users.remove(current_user)
+@app.post("/challenges/{challenge_id}/instance", response_model=schemas.Instance, status_code=202)
+def request_challenge_instance(challenge_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    db_challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id, models.Challenge.is_deleted == False).first()
+    if not db_challenge:
+        raise HTTPException(status_code=404, detail="Challenge not found")
+    if not db_challenge.docker_image:
+        raise HTTPException(status_code=400, detail="Challenge does not have a Docker image configured.")
+    instance = scheduler.scheduler.request_instance(db, current_user, challenge=db_challenge)
+    return _instance_response(db, instance)
+
+@app.get("/instances/me", response_model=list[schemas.Instance])
+def read_my_instances(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    instances = db.query(models.Instance).filter(
+        models.Instance.user_id == current_user.id,
+        models.Instance.status.in_(scheduler.PENDING_STATUSES)
+    ).order_by(models.Instance.id).all()
+    return [_instance_response(db, instance) for instance in instances]
+
+@app.get("/instances/{instance_id}", response_model=schemas.Instance)
+def read_instance(instance_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return _instance_response(db, _get_user_instance(instance_id, db, current_user))
+
+@app.post("/instances/{instance_id}/restart", response_model=schemas.Job, status_code=202)
+def restart_instance(instance_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    instance = _get_user_instance(instance_id, db, current_user)
+    if instance.status != "running":
+        raise HTTPException(status_code=400, detail="Instance is not running")
+    return orchestrator.orchestrator.submit("restart", "instance", instance.id, user_id=current_user.id)
+
+@app.post("/instances/{instance_id}/extend", response_model=schemas.Lease)
+def extend_instance(instance_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    instance = _get_user_instance(instance_id, db, current_user)
+    if instance.status != "running":
+        raise HTTPException(status_code=400, detail="Instance is not running")
+    instance.expires_at = models.lease_expiry()
+    db.commit()
+    db.refresh(instance)
+    return {"expires_at": instance.expires_at}
+
+@app.delete("/instances/{instance_id}", response_model=schemas.Instance)
+def stop_instance(instance_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    instance = _get_user_instance(instance_id, db, current_user)
+    if instance.status == "queued":
+        # Never admitted, so there is no container or reservation to release
+        instance.status = "stopped"
         db.commit()
-        db.refresh(db_machine)
-    else:
-        return {"message": "Machine is no longer active for you."}
-
-    #global
-    if not db_machine.active_users:
-        try:
-            client = docker.from_env()
-            container_name = f"vuln-app-{db_machine.id}"
-            try:
-                container = client.containers.get(container_name)
-                container.stop()
-                container.remove()
-            except docker.errors.NotFound:
-                pass 
-
-            # Clear the IP address from the database
-            db_machine.ip_address = None
-            db.add(db_machine)
-            db.commit()
-            
-            return {"message": f"Machine {db_machine.name} stopped globally."}
+    elif instance.status in ("starting", "running", "failed"):
+        instance.status = "stopping"
+        db.commit()
+        orchestrator.orchestrator.submit("stop", "instance", instance.id, user_id=current_user.id)
+    db.refresh(instance)
+    return _instance_response(db, instance)
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"An unexpected error occurred while stopping the machine: {e}")
+@app.get("/admin/scheduler", response_model=dict)
+def get_scheduler_capacity(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    return scheduler.scheduler.capacity(db)
 
-    return {"message": f"Machine {db_machine.name} is no longer active for you, but remains running for other users."}
+@app.get("/admin/capacity", response_model=dict)
+def get_capacity(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    capacity = scheduler.scheduler.capacity(db)
+    capacity["defaults"] = resources.default_profile().model_dump()
+    capacity["daemons"] = {name: manager.host_resources() for name, manager in docker_hosts.items()}
+    return capacity
 
-@app.post("/machines/{machine_id}/restart")
-def restart_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
-    if not db_machine:
-        raise HTTPException(status_code=404, detail="Machine not found")
+PROVISION_CONCURRENCY = int(os.getenv("PROVISION_CONCURRENCY", "4"))
 
+def _provision_machine_instances(machine_id: int, user_ids: list[int]) -> dict:
+    db = database.SessionLocal()
     try:
-      
-        if db_machine.ip_address is not None: 
-            client = docker.from_env()
-            container_name = f"vuln-app-{db_machine.id}"
-            try:
-                container = client.containers.get(container_name)
-                container.stop()
-                container.remove()
-            except docker.errors.NotFound:
-                pass 
-
-        db_machine.active_users.clear()
-        db_machine.ip_address = None
-        db.commit()
+        db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
+        instances = scheduler.scheduler.provision(db, db_machine, user_ids)
+        return {
+            "message": f"Queued machine {db_machine.name} for {len(instances)} users.",
+            "instances": [
+                {"id": instance.id, "user_id": instance.user_id, "status": instance.status, "queue_position": scheduler.scheduler.queue_position(db, instance)}
+                for instance in instances
+            ],
+        }
+    finally:
+        db.close()
+
+@app.post("/admin/provision")
+def bulk_provision(request: schemas.BulkProvisionRequest, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    targets = []
+    for item in request.items:
+        if (item.machine_id is None) == (item.challenge_id is None):
+            raise HTTPException(status_code=422, detail="Each item needs exactly one of machine_id or challenge_id")
+        if item.machine_id is not None:
+            if not db.query(models.Machine).filter(models.Machine.id == item.machine_id).first():
+                raise HTTPException(status_code=404, detail=f"Machine {item.machine_id} not found")
+            targets.append(("machine", item.machine_id, item.user_ids))
+        else:
+            if not db.query(models.Challenge).filter(models.Challenge.id == item.challenge_id).first():
+                raise HTTPException(status_code=404, detail=f"Challenge {item.challenge_id} not found")
+            targets.append(("challenge", item.challenge_id, item.user_ids))
+    concurrency = max(1, min(request.concurrency or PROVISION_CONCURRENCY, orchestrator.orchestrator.workers))
 
-       
-        ip_address = None
-        client = docker.from_env()
-        network = get_or_create_docker_network()
-        container_name = f"vuln-app-{db_machine.id}"
-        
-        try:
-            image = client.images.get(db_machine.source_identifier)
-            exposed_ports = image.attrs['Config'].get('ExposedPorts', {})
-            ports_to_publish = {port: None for port in exposed_ports.keys()}
-        except docker.errors.ImageNotFound:
-            raise HTTPException(status_code=404, detail=f"Docker image {db_machine.source_identifier} not found.")
-
-        container = client.containers.run(
-            db_machine.source_identifier,
-            name=container_name,
-            detach=True,
-            network=network.name,
-            ports=ports_to_publish
-        )
-        container.reload()
-        ip_address = container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
+    async def progress():
+        for host in docker_hosts:
+            try:
+                await asyncio.to_thread(containers.get_or_create_docker_network, host)
+            except Exception as e:
+                yield json.dumps({"event": "error", "detail": f"Docker network unavailable on {host}: {e}"}) + "\n"
+                return
+        yield json.dumps({"event": "started", "items": len(targets), "concurrency": concurrency}) + "\n"
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def provision(index, target_type, target_id, user_ids):
+            if target_type == "machine":
+                # Machines are per-user instances, so each user gets their own place in the scheduler queue
+                try:
+                    result = await asyncio.to_thread(_provision_machine_instances, target_id, user_ids)
+                    return index, target_type, target_id, None, "succeeded", result, None
+                except Exception as e:
+                    return index, target_type, target_id, None, "failed", None, str(e)
+            async with semaphore:
+                job = orchestrator.orchestrator.submit("provision", target_type, target_id, user_id=current_user.id, params={"user_ids": user_ids})
+                await orchestrator.orchestrator.wait(job)
+            return index, target_type, target_id, job.id, job.status, job.result, job.error
+
+        tasks = [asyncio.create_task(provision(index, *target)) for index, target in enumerate(targets)]
+        succeeded = 0
+        for finished in asyncio.as_completed(tasks):
+            index, target_type, target_id, job_id, status, result, error = await finished
+            if status == "succeeded":
+                succeeded += 1
+            yield json.dumps({
+                "event": "item",
+                "index": index,
+                "target_type": target_type,
+                "target_id": target_id,
+                "job_id": job_id,
+                "status": status,
+                "result": result,
+                "error": error,
+            }) + "\n"
+        yield json.dumps({"event": "done", "succeeded": succeeded, "failed": len(targets) - succeeded}) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+@app.get("/admin/password-pool", response_model=dict)
+def get_password_pool_metrics(current_user: models.User = Depends(auth.get_current_admin_user)):
+    return auth.password_pool.metrics()
+
+@app.get("/admin/db-pool", response_model=dict)
+def get_db_pool_metrics(current_user: models.User = Depends(auth.get_current_admin_user)):
+    return database.pool_metrics()
+
+@app.get("/admin/containers", response_model=dict)
+def get_container_states(current_user: models.User = Depends(auth.get_current_admin_user)):
+    return {
+        name: {"synced": manager.state.synced, "containers": manager.state.snapshot()}
+        for name, manager in docker_hosts.items()
+    }
 
-        
-        db_machine.ip_address = ip_address
-        db.commit()
+@app.get("/admin/warm-pool", response_model=list[dict])
+def get_warm_pool_status(current_user: models.User = Depends(auth.get_current_admin_user)):
+    return warm_pool.warm_pool.sizes_snapshot()
 
-        return {"message": f"Machine {db_machine.name} has been restarted successfully. New IP is {ip_address}."}
+@app.post("/machines/{machine_id}/extend", response_model=schemas.Lease)
+def extend_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    expires_at = leases.extend_machine_lease(db, machine_id, current_user.id)
+    if expires_at is None:
+        raise HTTPException(status_code=400, detail="Machine is not active for you")
+    return {"expires_at": expires_at}
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during restart: {e}")
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def get_job(job_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    job = orchestrator.orchestrator.get(job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.delete("/admin/machines/{machine_id}", status_code=200) 
 def delete_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
@@ -296,20 +439,19 @@ def delete_machine(machine_id: int, db: Session = Depends(database.get_db), curr
     if not db_machine:
         raise HTTPException(status_code=404, detail="Machine not found")
 
-    client = docker.from_env()
-    container_name = f"vuln-app-{db_machine.id}"
-    try:
-        container = client.containers.get(container_name)
-        container.stop()
-        container.remove()
-    except docker.errors.NotFound:
-        pass
+    containers.teardown_container(
+        containers.machine_container_name(db_machine.id),
+        containers.stop_timeout_from_config(db_machine.config_json),
+        host=db_machine.host
+    )
 
     
     db_machine.is_deleted = True
     db.add(db_machine)
     db.commit()
     db.refresh(db_machine)
+    response_cache.invalidate("machines")
+    _publish_machine("deleted", db_machine)
 
     return {"message": "Machine deleted successfully"}
 
@@ -358,6 +500,9 @@ def update_machine(machine_id: int, machine: schemas.MachineCreate, db: Session
     
     db.commit()
     db.refresh(db_machine)
+    flag_index.load_machine(db, db_machine.id)
+    response_cache.invalidate("machines")
+    _publish_machine("updated", db_machine)
 
     return db_machine
 
@@ -380,16 +525,21 @@ def create_changelog_entry(
     db.add(db_changelog)
     db.commit()
     db.refresh(db_changelog)
+    response_cache.invalidate(f"changelog:{machine_id}")
     return db_changelog
 
 @app.get("/machines/{machine_id}/changelog", response_model=list[schemas.Changelog])
-def get_changelog_entries(machine_id: int, db: Session = Depends(database.get_db)):
+def get_changelog_entries(machine_id: int, request: Request, db: Session = Depends(database.get_db)):
+    cache_key, cached = response_cache.lookup(request, None, (f"changelog:{machine_id}",))
+    if cached is not None:
+        return cached
+
     db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
     if not db_machine:
         raise HTTPException(status_code=404, detail="Machine not found")
 
     changelog_entries = db.query(models.Changelog).filter(models.Changelog.machine_id == machine_id).order_by(models.Changelog.timestamp.desc()).all()
-    return changelog_entries
+    return response_cache.store(request, cache_key, _dump(_changelog_list, changelog_entries))
 
 @app.post("/vpn/generate-config")
 async def generate_vpn_config(current_user: models.User = Depends(auth.get_current_user)):
@@ -424,128 +574,65 @@ async def generate_vpn_config(current_user: models.User = Depends(auth.get_curre
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
 @app.post("/submissions/", response_model=schemas.Submission)
-def create_submission(submission: schemas.SubmissionCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    machine = db.query(models.Machine).filter(models.Machine.id == submission.machine_id).first()
+async def create_submission(submission: schemas.SubmissionCreate, request: Request, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    machine = await db.get(models.Machine, submission.machine_id)
     if not machine:
         raise HTTPException(status_code=404, detail="Machine not found")
 
     # Check if the submitted flag is one of the correct flags for this machine
-    is_correct_flag = db.query(models.Flag).filter(
-        models.Flag.machine_id == submission.machine_id,
-        models.Flag.flag == submission.flag
-    ).first()
+    flag_id = flag_index.verify("machine", submission.machine_id, submission.flag)
 
-    if not is_correct_flag:
+    if flag_id is None:
         raise HTTPException(status_code=400, detail="Incorrect flag")
 
-    db_submission = db.query(models.Submission).filter(
-        models.Submission.user_id == current_user.id,
-        models.Submission.machine_id == submission.machine_id,
-        models.Submission.flag_id == is_correct_flag.id # Check 
-    ).first()
-    if db_submission:
+    # uq_submissions_user_flag turns a repeat into a no-op instead of a separate lookup
+    insert = database.dialect_insert(db.get_bind())
+    db_submission = await db.scalar(
+        insert(models.Submission).values(
+            user_id=current_user.id,
+            machine_id=submission.machine_id,
+            flag=submission.flag,
+            flag_id=flag_id
+        ).on_conflict_do_nothing(
+            index_elements=[models.Submission.user_id, models.Submission.flag_id]
+        ).returning(models.Submission)
+    )
+    if db_submission is None:
         raise HTTPException(status_code=400, detail="Flag already submitted")
 
-    db_submission = models.Submission(
-        user_id=current_user.id,
-        machine_id=submission.machine_id,
-        flag=submission.flag,
-        flag_id=is_correct_flag.id # Store the flag_id
+    # The score moves in the same transaction as the submission that earned it. The
+    # upsert also locks the user's score row, so two of this user's submits cannot
+    # both take the check below for their first flag on the machine.
+    standing = await scoreboard.add_points(db, current_user.id, scoreboard.MACHINE_FLAG_POINTS, machine_flags=1)
+
+    # Count the solve on the user's first flag for this machine
+    solves = await db.scalar(
+        update(models.Machine).where(
+            models.Machine.id == submission.machine_id,
+            ~select(models.Submission.id).where(
+                models.Submission.user_id == current_user.id,
+                models.Submission.machine_id == submission.machine_id,
+                models.Submission.id != db_submission.id
+            ).exists()
+        ).values(solves=models.Machine.solves + 1)
+        .returning(models.Machine.solves)
+        .execution_options(synchronize_session=False)
     )
-    db.add(db_submission)
-    db.commit()
-    db.refresh(db_submission)
-
-    # Check if this is the first successful submission by this user for this machine
-    existing_submissions_by_user_for_machine = db.query(models.Submission).filter(
-        models.Submission.user_id == current_user.id,
-        models.Submission.machine_id == submission.machine_id
-    ).count()
-
-    if existing_submissions_by_user_for_machine == 1: # This is the first unique flag for this user on this machine
-        machine.solves += 1
-        db.add(machine)
-        db.commit()
-        db.refresh(machine)
-    
+    await db.commit()
+    scoreboard.rank_index.update(current_user.id, current_user.username, *standing)
+    # Solve counts on the replica lag behind; this client's next listings come from the primary
+    database.session_router.mark_write(database.client_key(request))
+    if solves is not None:
+        # Cached machine listings carry the solve count, and would otherwise serve it stale
+        response_cache.invalidate("machines")
+
+    first_blood = solves == 1
+    _publish_solve(current_user, "machine", machine.id, machine.name, standing[0], first_blood)
     return db_submission
 
 @app.get("/admin/analytics", response_model=dict)
-def get_admin_analytics(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
-    total_users = db.query(models.User).count()
-    total_machines = db.query(models.Machine).count()
-    total_submissions = db.query(models.Submission).count()
-
-    # User registration trends (e.g., users registered per day)
-    user_registration_trends = [
-        {"date": item.created_at.isoformat(), "count": item.count}
-        for item in db.query(
-            models.User.created_at,
-            func.count(models.User.id).label('count')
-        ).group_by(models.User.created_at).order_by(models.User.created_at).all()
-    ]
-
-    # Submission trends 
-    submission_trends = [
-        {"date": item.created_at.isoformat(), "count": item.count}
-        for item in db.query(
-            models.Submission.created_at,
-            func.count(models.Submission.id).label('count')
-        ).group_by(models.Submission.created_at).order_by(models.Submission.created_at).all()
-    ]
-
-    # Machine popularity (most started machines - requires a new field or logging starts)
-    # For now, let's use submissions as a proxy for popularity
-    machine_popularity = [
-        {"name": item.name, "submission_count": item.submission_count}
-        for item in db.query(
-            models.Machine.name,
-            func.count(models.Submission.id).label('submission_count')
-        ).join(models.Submission).group_by(models.Machine.name).order_by(func.count(models.Submission.id).desc()).limit(5).all()
-    ]
-
-    # Top users by submissions
-    top_users = [
-        {"username": item.username, "submission_count": item.submission_count}
-        for item in db.query(
-            models.User.username,
-            func.count(models.Submission.id).label('submission_count')
-        ).join(models.Submission).group_by(models.User.username).order_by(func.count(models.Submission.id).desc()).limit(5).all()
-    ]
-
-    # Machine completion rates
-    machine_completion_rates = []
-    machines = db.query(models.Machine).all()
-    for machine in machines:
-        successful_submissions_for_machine = db.query(models.Submission.user_id).distinct().filter(
-            models.Submission.machine_id == machine.id
-        ).join(models.Flag, (models.Submission.machine_id == models.Flag.machine_id) & (models.Submission.flag == models.Flag.flag)).count()
-
-        total_users_attempted = db.query(models.Submission.user_id).distinct().filter(
-            models.Submission.machine_id == machine.id
-        ).count()
-
-        completion_rate = 0
-        if total_users_attempted > 0:
-            completion_rate = (successful_submissions_for_machine / total_users_attempted) * 100
-
-        machine_completion_rates.append({
-            "name": machine.name,
-            "completion_rate": round(completion_rate, 2),
-            "completed_count": successful_submissions_for_machine,
-            "total_users_attempted": total_users_attempted
-        })
-
-    return {
-        "total_users": total_users,
-        "total_machines": total_machines,
-        "total_submissions": total_submissions,
-        "user_registration_trends": user_registration_trends,
-        "submission_trends": submission_trends,
-        "machine_popularity": machine_popularity,
-        "top_users": top_users,
-        "machine_completion_rates": machine_completion_rates
-    }
+def get_admin_analytics(days: int = Query(30, ge=1, le=analytics.ANALYTICS_MAX_DAYS), db: Session = Depends(database.get_read_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    return analytics.dashboard(db, days)
 
 @app.get("/admin/machines/difficulty_distribution", response_model=list[dict])
 def get_machine_difficulty_distribution(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
@@ -557,12 +644,12 @@ def get_machine_difficulty_distribution(db: Session = Depends(database.get_db),
 
 @app.get("/admin/machines/all", response_model=list[schemas.Machine])
 def read_all_machines_admin(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
-    machines = db.query(models.Machine).offset(skip).limit(limit).all()
+    machines = db.query(models.Machine).options(selectinload(models.Machine.flags), selectinload(models.Machine.active_users)).offset(skip).limit(limit).all()
     return machines
 
 @app.get("/admin/machines/{machine_id}", response_model=schemas.Machine)
 def read_admin_machine(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
-    db_machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
+    db_machine = db.query(models.Machine).options(selectinload(models.Machine.flags), selectinload(models.Machine.active_users)).filter(models.Machine.id == machine_id).first()
     if db_machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
     return db_machine
@@ -578,9 +665,13 @@ def update_user(user_id: int, user: schemas.UserUpdate, db: Session = Depends(da
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    role_changed = db_user.role != user.role
     db_user.role = user.role
     db.commit()
     db.refresh(db_user)
+    auth.principal_cache.invalidate(user_id)
+    if role_changed:
+        auth.revoke_user_tokens(db, user_id)
     return db_user
 
 @app.delete("/admin/users/{user_id}", status_code=200)
@@ -589,93 +680,183 @@ def delete_user(user_id: int, db: Session = Depends(database.get_db), current_us
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    db.query(models.UserScore).filter(models.UserScore.user_id == user_id).delete()
+    rollups.forget_registration(db, db_user.created_at)
     db.delete(db_user)
     db.commit()
+    response_cache.invalidate("users")
+    auth.principal_cache.invalidate(user_id)
+    scoreboard.rank_index.remove(user_id)
+    auth.revoke_user_tokens(db, user_id)
     return {"message": "User deleted successfully"}
 
 @app.get("/admin/stats", response_model=dict)
-def get_admin_stats(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+def get_admin_stats(request: Request, db: Session = Depends(database.get_read_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    cache_key, cached = response_cache.lookup(request, current_user.role, ("machines", "users"))
+    if cached is not None:
+        return cached
+
     total_users = db.query(models.User).count()
     active_machines = db.query(models.Machine).filter(models.Machine.ip_address != None).count()
     total_submissions = db.query(models.Submission).count() + db.query(models.ChallengeSubmission).count()
     active_sessions = db.query(models.User).join(models.active_machines_association).distinct().count()
 
-    return {
+    return response_cache.store(request, cache_key, json.dumps({
         "total_users": total_users,
         "active_machines": active_machines,
         "total_submissions": total_submissions,
         "active_sessions": active_sessions,
-    }
+    }).encode())
 
 @app.get("/users/me/score", response_model=dict)
-def get_my_score(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    score = db.query(models.Submission.flag_id).filter(
-        models.Submission.user_id == current_user.id
-    ).distinct().count()
-    return {"score": score}
+async def get_my_score(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    score = await db.scalar(select(models.UserScore.score).where(models.UserScore.user_id == current_user.id))
+    return {"score": score or 0}
+
+@app.get("/leaderboard", response_model=schemas.Leaderboard)
+def read_leaderboard(skip: int = 0, limit: int = 50, current_user: models.User = Depends(auth.get_current_user)):
+    limit = max(0, min(limit, 200))
+    return {
+        "total": len(scoreboard.rank_index),
+        "entries": scoreboard.rank_index.page(max(0, skip), limit),
+        "me": scoreboard.rank_index.entry(current_user.id),
+    }
+
+@app.get("/announcements/", response_model=list[schemas.Announcement])
+def read_announcements(skip: int = 0, limit: int = 20, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return db.query(models.Announcement).order_by(models.Announcement.created_at.desc(), models.Announcement.id.desc()).offset(skip).limit(limit).all()
+
+@app.post("/admin/announcements", response_model=schemas.Announcement)
+def create_announcement(announcement: schemas.AnnouncementCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
+    db_announcement = models.Announcement(title=announcement.title, description=announcement.description)
+    db.add(db_announcement)
+    db.commit()
+    db.refresh(db_announcement)
+    events.event_hub.publish("announcement", schemas.Announcement.model_validate(db_announcement).model_dump(mode="json"))
+    return db_announcement
+
+@app.get("/events")
+async def stream_events(request: Request, token: str, types: str | None = None, db: AsyncSession = Depends(database.get_async_db)):
+    # EventSource cannot set headers, so the access token comes in the query string
+    current_user = await auth.get_current_user(token, db)
+    await db.close()
+    subscribed = events.parse_types(types)
+
+    async def stream():
+        with events.event_hub.subscribe(current_user.id, subscribed) as subscription:
+            while True:
+                event = await subscription.next()
+                # Expiry or a logout closes the stream; the client refreshes its token and reconnects
+                if not auth.access_token_valid(token):
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["id"] is not None:
+                    yield f"id: {event['id']}\n"
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket, token: str, types: str | None = None):
+    async with database.AsyncSessionLocal() as db:
+        try:
+            current_user = await auth.get_current_user(token, db)
+        except HTTPException:
+            await websocket.close(code=1008)
+            return
+    await websocket.accept()
+    with events.event_hub.subscribe(current_user.id, events.parse_types(types)) as subscription:
+        try:
+            while True:
+                event = await subscription.next()
+                if not auth.access_token_valid(token):
+                    await websocket.close(code=1008)
+                    return
+                await websocket.send_json(event if event is not None else {"id": None, "type": "keepalive", "data": {}})
+        except WebSocketDisconnect:
+            pass
+
+@app.get("/admin/cache", response_model=dict)
+def get_response_cache_metrics(current_user: models.User = Depends(auth.get_current_admin_user)):
+    return response_cache.metrics()
+
+@app.get("/admin/events", response_model=dict)
+def get_event_hub_metrics(current_user: models.User = Depends(auth.get_current_admin_user)):
+    return events.event_hub.metrics()
 
 @app.get("/users/me/submissions", response_model=list[schemas.Submission])
-def get_my_submissions(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    submissions = db.query(models.Submission).filter(models.Submission.user_id == current_user.id).all()
+async def get_my_submissions(db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    submissions = (await db.scalars(select(models.Submission).where(models.Submission.user_id == current_user.id))).all()
     return submissions
 
 @app.get("/machines/{machine_id}/flags_status", response_model=list[dict])
-def get_machine_flags_status(machine_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    machine = db.query(models.Machine).filter(models.Machine.id == machine_id).first()
+async def get_machine_flags_status(machine_id: int, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    machine = await db.get(models.Machine, machine_id, options=[selectinload(models.Machine.flags)])
     if not machine:
         raise HTTPException(status_code=404, detail="Machine not found")
 
+    # One query for everything this user solved here instead of one per flag
+    submitted_flag_ids = set((await db.scalars(select(models.Submission.flag_id).where(
+        models.Submission.user_id == current_user.id,
+        models.Submission.machine_id == machine_id
+    ))).all())
     flags_status = []
     for flag in machine.flags:
         if flag.is_deleted: # Skip deleted flags
             continue
-        is_submitted = db.query(models.Submission).filter(
-            models.Submission.user_id == current_user.id,
-            models.Submission.machine_id == machine_id,
-            models.Submission.flag_id == flag.id
-        ).first() is not None
-        flags_status.append({"id": flag.id, "flag": flag.flag, "is_submitted": is_submitted})
+        flags_status.append({"id": flag.id, "flag": flag.flag, "is_submitted": flag.id in submitted_flag_ids})
     return flags_status
 
-@app.get("/challenges", response_model=list[schemas.Challenge])
-def read_challenges(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    challenges = db.query(models.Challenge).filter(models.Challenge.is_deleted == False).offset(skip).limit(limit).all()
-    return challenges
+@app.get("/challenges", response_model=list[schemas.ChallengeSummary])
+async def read_challenges(request: Request, skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_async_read_db)):
+    cache_key, cached = response_cache.lookup(request, None, ("challenges",))
+    if cached is not None:
+        return cached
+
+    challenges = (await db.scalars(
+        select(models.Challenge).options(models.active_user_count(models.Challenge)).where(models.Challenge.is_deleted == False).offset(skip).limit(limit)
+    )).all()
+    return response_cache.store(request, cache_key, _dump(_challenge_summaries, challenges))
 
 @app.get("/challenges/{challenge_id}", response_model=schemas.Challenge)
-def read_challenge(challenge_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def read_challenge(challenge_id: int, request: Request, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    cache_key, cached = response_cache.lookup(request, None, ("challenges",))
+    if cached is not None:
+        return cached
+
     db_challenge = db.query(models.Challenge).options(selectinload(models.Challenge.active_users), selectinload(models.Challenge.flags)).filter(models.Challenge.id == challenge_id).first()
     if db_challenge is None:
         raise HTTPException(status_code=404, detail="Challenge not found")
-    return db_challenge
+    return response_cache.store(request, cache_key, _dump(_challenge, db_challenge))
 
 @app.get("/challenges/{challenge_id}/flags_status", response_model=list[dict])
-def get_challenge_flags_status(challenge_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+async def get_challenge_flags_status(challenge_id: int, db: AsyncSession = Depends(database.get_async_db), current_user: models.User = Depends(auth.get_current_user)):
+    challenge = await db.get(models.Challenge, challenge_id, options=[selectinload(models.Challenge.flags)])
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
+    submitted_flag_ids = set((await db.scalars(select(models.ChallengeSubmission.challenge_flag_id).where(
+        models.ChallengeSubmission.user_id == current_user.id,
+        models.ChallengeSubmission.challenge_id == challenge_id,
+        models.ChallengeSubmission.is_correct == True
+    ))).all())
     flags_status = []
     for flag in challenge.flags:
         if flag.is_deleted: # Skip deleted flags
             continue
-        is_submitted = db.query(models.ChallengeSubmission).filter(
-            models.ChallengeSubmission.user_id == current_user.id,
-            models.ChallengeSubmission.challenge_id == challenge_id,
-            models.ChallengeSubmission.challenge_flag_id == flag.id,
-            models.ChallengeSubmission.is_correct == True
-        ).first() is not None
-        flags_status.append({"id": flag.id, "flag": flag.flag, "is_submitted": is_submitted})
+        flags_status.append({"id": flag.id, "flag": flag.flag, "is_submitted": flag.id in submitted_flag_ids})
     return flags_status
 
 @app.get("/admin/challenges/all", response_model=list[schemas.Challenge])
 def read_all_challenges_admin(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
-    challenges = db.query(models.Challenge).offset(skip).limit(limit).all()
+    challenges = db.query(models.Challenge).options(selectinload(models.Challenge.flags), selectinload(models.Challenge.active_users)).offset(skip).limit(limit).all()
     return challenges
 
 @app.get("/admin/challenges/{challenge_id}", response_model=schemas.Challenge)
 def read_admin_challenge(challenge_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_admin_user)):
-    db_challenge = db.query(models.Challenge).options(selectinload(models.Challenge.flags)).filter(models.Challenge.id == challenge_id).first()
+    db_challenge = db.query(models.Challenge).options(selectinload(models.Challenge.flags), selectinload(models.Challenge.active_users)).filter(models.Challenge.id == challenge_id).first()
     if db_challenge is None:
         raise HTTPException(status_code=404, detail="Challenge not found")
     return db_challenge
@@ -719,6 +900,8 @@ def update_challenge(challenge_id: int, challenge: schemas.ChallengeCreate, db:
     
     db.commit()
     db.refresh(db_challenge)
+    flag_index.load_challenge(db, db_challenge.id)
+    response_cache.invalidate("challenges")
 
     return db_challenge
 
@@ -732,6 +915,8 @@ def delete_challenge(challenge_id: int, db: Session = Depends(database.get_db),
     db.add(db_challenge)
     db.commit()
     db.refresh(db_challenge)
+    response_cache.invalidate("challenges")
+    _publish_challenge("deleted", db_challenge)
     return {"message": "Challenge soft-deleted successfully"}
 
 @app.post("/admin/challenges/{challenge_id}/start", response_model=schemas.Challenge)
@@ -747,38 +932,14 @@ def start_challenge(challenge_id: int, db: Session = Depends(database.get_db), c
         return db_challenge
 
     try:
-        client = docker.from_env()
-        network = get_or_create_docker_network()
-        container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-
-        try:
-            # Clean up old container if it exists
-            container = client.containers.get(container_name)
-            container.stop()
-            container.remove()
-        except docker.errors.NotFound:
-            pass # No existing container, proceed
-
-        # Check if image exists
-        try:
-            client.images.get(db_challenge.docker_image)
-        except docker.errors.ImageNotFound:
-            raise HTTPException(status_code=404, detail=f"Docker image {db_challenge.docker_image} not found.")
-
-        container = client.containers.run(
-            db_challenge.docker_image,
-            name=container_name,
-            detach=True,
-            network=network.name,
-            # No ports published by default, challenges might expose services internally
-        )
-        container.reload()
-        challenge_ip_address = container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
+        challenge_ip_address, db_challenge.host = placement.start_container(db, db_challenge.docker_image, containers.challenge_container_name(db_challenge), publish_ports=False)
 
         db_challenge.ip_address = challenge_ip_address
         db.add(db_challenge)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
+        _publish_challenge("started", db_challenge)
         return db_challenge
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start Docker container for challenge: {e}")
@@ -796,20 +957,15 @@ def stop_challenge(challenge_id: int, db: Session = Depends(database.get_db), cu
         return db_challenge
 
     try:
-        client = docker.from_env()
-        container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-
-        try:
-            container = client.containers.get(container_name)
-            container.stop()
-            container.remove()
-        except docker.errors.NotFound:
-            pass # Already stopped
+        containers.teardown_container(containers.challenge_container_name(db_challenge), host=db_challenge.host)
 
         db_challenge.ip_address = None
+        db_challenge.host = None
         db.add(db_challenge)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
+        _publish_challenge("stopped", db_challenge)
         return db_challenge
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to stop Docker container for challenge: {e}")
@@ -826,40 +982,16 @@ def restart_admin_challenge(challenge_id: int, db: Session = Depends(database.ge
     try:
         # --- Step 1: Hard stop the challenge container if it's running ---
         if db_challenge.ip_address is not None:
-            client = docker.from_env()
-            container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-            try:
-                container = client.containers.get(container_name)
-                container.stop()
-                container.remove()
-            except docker.errors.NotFound:
-                pass # Already stopped or never started
+            containers.teardown_container(containers.challenge_container_name(db_challenge), host=db_challenge.host)
 
         # --- Step 2: Clear active users and IP address in DB ---
         db_challenge.active_users.clear()
         db_challenge.ip_address = None
+        db_challenge.host = None
         db.commit()
 
         # --- Step 3: Start a new container for the challenge ---
-        client = docker.from_env()
-        network = get_or_create_docker_network()
-        container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-
-        # Check if image exists
-        try:
-            client.images.get(db_challenge.docker_image)
-        except docker.errors.ImageNotFound:
-            raise HTTPException(status_code=404, detail=f"Docker image {db_challenge.docker_image} not found.")
-
-        container = client.containers.run(
-            db_challenge.docker_image,
-            name=container_name,
-            detach=True,
-            network=network.name,
-            # No ports published by default, challenges might expose services internally
-        )
-        container.reload()
-        challenge_ip_address = container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
+        challenge_ip_address, db_challenge.host = placement.start_container(db, db_challenge.docker_image, containers.challenge_container_name(db_challenge), publish_ports=False)
 
         # --- Step 4: Update DB with new IP and active user (the one who restarted) ---
         db_challenge.ip_address = challenge_ip_address
@@ -868,6 +1000,7 @@ def restart_admin_challenge(challenge_id: int, db: Session = Depends(database.ge
         db.add(db_challenge)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
 
         return {"message": f"Challenge {db_challenge.title} has been restarted successfully. New IP is {challenge_ip_address}."}
     except Exception as e:
@@ -882,10 +1015,12 @@ def start_challenge_user(challenge_id: int, db: Session = Depends(database.get_d
         raise HTTPException(status_code=400, detail="Challenge does not have a Docker image configured.")
 
     # Add the current user to the list of active users for this challenge
-    if current_user not in db_challenge.active_users:
-        db_challenge.active_users.append(current_user)
+    db_user = auth.load_user(db, current_user)
+    if db_user not in db_challenge.active_users:
+        db_challenge.active_users.append(db_user)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
     else:
         # If user wasn't active, just return a success message.
         return db_challenge # Or raise HTTPException(status_code=400, detail="User not active on this challenge")
@@ -895,38 +1030,13 @@ def start_challenge_user(challenge_id: int, db: Session = Depends(database.get_d
         return db_challenge
 
     try:
-        client = docker.from_env()
-        network = get_or_create_docker_network()
-        container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-
-        try:
-            # Clean up old container if it exists
-            container = client.containers.get(container_name)
-            container.stop()
-            container.remove()
-        except docker.errors.NotFound:
-            pass # No existing container, proceed
-
-        # Check if image exists
-        try:
-            client.images.get(db_challenge.docker_image)
-        except docker.errors.ImageNotFound:
-            raise HTTPException(status_code=404, detail=f"Docker image {db_challenge.docker_image} not found.")
-
-        container = client.containers.run(
-            db_challenge.docker_image,
-            name=container_name,
-            detach=True,
-            network=network.name,
-            # No ports published by default, challenges might expose services internally
-        )
-        container.reload()
-        challenge_ip_address = container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
+        challenge_ip_address, db_challenge.host = placement.start_container(db, db_challenge.docker_image, containers.challenge_container_name(db_challenge), publish_ports=False)
 
         db_challenge.ip_address = challenge_ip_address
         db.add(db_challenge)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
         print(f"--- After start_challenge_user: active_users={[user.username for user in db_challenge.active_users]}, ip_address={db_challenge.ip_address} ---")
         return db_challenge
     except Exception as e:
@@ -941,10 +1051,12 @@ def stop_challenge_user(challenge_id: int, db: Session = Depends(database.get_db
         raise HTTPException(status_code=400, detail="Challenge does not have a Docker image configured.")
 
     # Remove the current user from the list of active users for this challenge
-    if current_user in db_challenge.active_users:
-        db_challenge.active_users.remove(current_user)
+    db_user = auth.load_user(db, current_user)
+    if db_user in db_challenge.active_users:
+        db_challenge.active_users.remove(db_user)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
         print(f"--- After removing user from active_users: active_users={[user.username for user in db_challenge.active_users]}, ip_address={db_challenge.ip_address} ---")
     else:
         # If user wasn't active, just return a success message.
@@ -953,20 +1065,14 @@ def stop_challenge_user(challenge_id: int, db: Session = Depends(database.get_db
     # If no users are left, stop the challenge globally
     if not db_challenge.active_users:
         try:
-            client = docker.from_env()
-            container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-
-            try:
-                container = client.containers.get(container_name)
-                container.stop()
-                container.remove()
-            except docker.errors.NotFound:
-                pass # Already stopped
+            containers.teardown_container(containers.challenge_container_name(db_challenge), host=db_challenge.host)
 
             db_challenge.ip_address = None
+            db_challenge.host = None
             db.add(db_challenge)
             db.commit()
             db.refresh(db_challenge)
+            response_cache.invalidate("challenges")
             print(f"--- After stopping challenge globally: active_users={[user.username for user in db_challenge.active_users]}, ip_address={db_challenge.ip_address} ---")
             return {"message": f"Challenge {db_challenge.title} stopped globally."}
             
@@ -975,6 +1081,13 @@ def stop_challenge_user(challenge_id: int, db: Session = Depends(database.get_db
 
     return {"message": f"Challenge {db_challenge.title} is no longer active for you, but remains running for other users."}
 
+@app.post("/challenges/{challenge_id}/extend", response_model=schemas.Lease)
+def extend_challenge(challenge_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    expires_at = leases.extend_challenge_lease(db, challenge_id, current_user.id)
+    if expires_at is None:
+        raise HTTPException(status_code=400, detail="Challenge is not active for you")
+    return {"expires_at": expires_at}
+
 @app.post("/challenges/{challenge_id}/restart", response_model=schemas.Challenge)
 def restart_challenge_user(challenge_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
@@ -986,47 +1099,24 @@ def restart_challenge_user(challenge_id: int, db: Session = Depends(database.get
     try:
         # --- Step 1: Hard stop the challenge container if it's running ---
         if db_challenge.ip_address is not None:
-            client = docker.from_env()
-            container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-            try:
-                container = client.containers.get(container_name)
-                container.stop()
-                container.remove()
-            except docker.errors.NotFound:
-                pass # Already stopped or never started
+            containers.teardown_container(containers.challenge_container_name(db_challenge), host=db_challenge.host)
 
         # --- Step 2: Clear active users and IP address in DB ---
         db_challenge.active_users.clear()
         db_challenge.ip_address = None
+        db_challenge.host = None
         db.commit()
 
         # --- Step 3: Start a new container for the challenge ---
-        client = docker.from_env()
-        network = get_or_create_docker_network()
-        container_name = f"challenge-{db_challenge.title.replace(' ', '-').lower()}-{db_challenge.id}"
-
-        # Check if image exists
-        try:
-            client.images.get(db_challenge.docker_image)
-        except docker.errors.ImageNotFound:
-            raise HTTPException(status_code=404, detail=f"Docker image {db_challenge.docker_image} not found.")
-
-        container = client.containers.run(
-            db_challenge.docker_image,
-            name=container_name,
-            detach=True,
-            network=network.name,
-            # No ports published by default, challenges might expose services internally
-        )
-        container.reload()
-        challenge_ip_address = container.attrs['NetworkSettings']['Networks'][VULNVERSE_NETWORK_NAME]['IPAddress']
+        challenge_ip_address, db_challenge.host = placement.start_container(db, db_challenge.docker_image, containers.challenge_container_name(db_challenge), publish_ports=False)
 
         # --- Step 4: Update DB with new IP and active user (the one who restarted) ---
         db_challenge.ip_address = challenge_ip_address
-        db_challenge.active_users.append(current_user) # Add current user as active after restart
+        db_challenge.active_users.append(auth.load_user(db, current_user)) # Add current user as active after restart
         db.add(db_challenge)
         db.commit()
         db.refresh(db_challenge)
+        response_cache.invalidate("challenges")
 
         return {"message": f"Challenge {db_challenge.title} has been restarted successfully. New IP is {challenge_ip_address}."}
     except Exception as e:
@@ -1082,52 +1172,69 @@ def create_admin_challenge(
         db.add(db_challenge_flag)
     db.commit()
     db.refresh(db_challenge) # Refresh again to load flags relationship
+    flag_index.load_challenge(db, db_challenge.id)
+    response_cache.invalidate("challenges")
+    _publish_challenge("created", db_challenge)
 
     return db_challenge
 
 @app.post("/challenges/{challenge_id}/submit", response_model=schemas.ChallengeSubmission)
-def submit_challenge_flag(
+async def submit_challenge_flag(
     challenge_id: int,
     submission: schemas.ChallengeSubmissionCreate,
-    db: Session = Depends(database.get_db),
+    request: Request,
+    db: AsyncSession = Depends(database.get_async_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    challenge = db.query(models.Challenge).filter(models.Challenge.id == challenge_id).first()
+    challenge = await db.get(models.Challenge, challenge_id)
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
-    # Verify the submitted flag against all stored flags for the challenge
-    is_correct = False
-    correct_challenge_flag = None
-    for cf in challenge.flags:
-        if submission.flag == cf.flag:
-            is_correct = True
-            correct_challenge_flag = cf
-            break
+    # Verify the submitted flag against the active flags for the challenge
+    challenge_flag_id = flag_index.verify("challenge", challenge_id, submission.flag)
 
-    if not is_correct:
+    if challenge_flag_id is None:
         raise HTTPException(status_code=400, detail="Incorrect flag")
 
-    # Check for duplicate submission of this specific challenge flag by this user
-    db_submission = db.query(models.ChallengeSubmission).filter(
-        models.ChallengeSubmission.user_id == current_user.id,
-        models.ChallengeSubmission.challenge_id == challenge_id,
-        models.ChallengeSubmission.challenge_flag_id == correct_challenge_flag.id, # Check for specific flag ID
-        models.ChallengeSubmission.is_correct == True # Only consider correct submissions as duplicates
-    ).first()
-
-    if db_submission:
-        raise HTTPException(status_code=400, detail="Flag already submitted correctly for this challenge")
-
-    new_submission = models.ChallengeSubmission(
-        user_id=current_user.id,
-        challenge_id=challenge_id,
-        challenge_flag_id=correct_challenge_flag.id, # Store the ID of the correct flag
-        submitted_flag=submission.flag, # Store submitted flag
-        is_correct=True # It's correct if we reached here
+    # uq_challenge_submissions_user_flag_correct turns a repeat into a no-op, even when two submits race
+    insert = database.dialect_insert(db.get_bind())
+    new_submission = await db.scalar(
+        insert(models.ChallengeSubmission).values(
+            user_id=current_user.id,
+            challenge_id=challenge_id,
+            challenge_flag_id=challenge_flag_id, # Store the ID of the correct flag
+            submitted_flag=submission.flag, # Store submitted flag
+            is_correct=True # It's correct if we reached here
+        ).on_conflict_do_nothing(
+            index_elements=[models.ChallengeSubmission.user_id, models.ChallengeSubmission.challenge_flag_id],
+            index_where=text("is_correct")
+        ).returning(models.ChallengeSubmission)
     )
-    db.add(new_submission)
-    db.commit()
-    db.refresh(new_submission)
+    if new_submission is None:
+        raise HTTPException(status_code=400, detail="Flag already submitted correctly for this challenge")
 
-    return new_submission
\ No newline at end of file
+    standing = None
+    first_blood = False
+    # Two different flags of one challenge submitted at once would each miss the other's
+    # uncommitted row; the score row lock makes the second wait and see the first.
+    await scoreboard.lock_score(db, current_user.id)
+    solved_before = await db.scalar(select(models.ChallengeSubmission.id).where(
+        models.ChallengeSubmission.user_id == current_user.id,
+        models.ChallengeSubmission.challenge_id == challenge_id,
+        models.ChallengeSubmission.is_correct == True,
+        models.ChallengeSubmission.id != new_submission.id
+    ).limit(1)) is not None
+    if not solved_before: # A challenge's points are awarded once, on its first correct flag
+        standing = await scoreboard.add_points(db, current_user.id, challenge.points or 0, challenge_solves=1)
+        first_blood = await db.scalar(select(models.ChallengeSubmission.id).where(
+            models.ChallengeSubmission.challenge_id == challenge_id,
+            models.ChallengeSubmission.is_correct == True,
+            models.ChallengeSubmission.user_id != current_user.id
+        ).limit(1)) is None
+    await db.commit()
+    if standing is not None:
+        scoreboard.rank_index.update(current_user.id, current_user.username, *standing)
+        _publish_solve(current_user, "challenge", challenge.id, challenge.title, standing[0], first_blood)
+    database.session_router.mark_write(database.client_key(request))
+
+    return new_submission
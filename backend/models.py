@@ -1,20 +1,29 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Table
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Table, Float, UniqueConstraint, Date, Index, select, text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import query_expression, relationship, with_expression
+from datetime import datetime, timedelta, timezone
 from database import Base
+import os
+
+LEASE_DURATION_MINUTES = int(os.getenv("LEASE_DURATION_MINUTES", "120"))
+
+def lease_expiry():
+    return datetime.now(timezone.utc) + timedelta(minutes=LEASE_DURATION_MINUTES)
 
 # many-to-many
 active_machines_association = Table(
     'active_machines', Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('machine_id', Integer, ForeignKey('machines.id'), primary_key=True)
+    Column('machine_id', Integer, ForeignKey('machines.id'), primary_key=True),
+    Column('expires_at', DateTime(timezone=True), default=lease_expiry, index=True)
 )
 
 # many-to-many 
 active_challenges_association = Table(
     'active_challenges', Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
-    Column('challenge_id', Integer, ForeignKey('challenges.id'), primary_key=True)
+    Column('challenge_id', Integer, ForeignKey('challenges.id'), primary_key=True),
+    Column('expires_at', DateTime(timezone=True), default=lease_expiry, index=True)
 )
 
 class User(Base):
@@ -25,7 +34,7 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     password = Column(String)
     role = Column(String, default="user") # New role column
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     submissions = relationship("Submission", back_populates="user")
     active_machines = relationship("Machine", secondary=active_machines_association, back_populates="active_users")
@@ -40,6 +49,7 @@ class Machine(Base):
     description = Column(String)
     source_identifier = Column(String, nullable=True) 
     ip_address = Column(String, nullable=True)
+    host = Column(String, nullable=True)
     category = Column(String, nullable=True)
     difficulty = Column(String, nullable=True)
     is_deleted = Column(Boolean, default=False) 
@@ -54,6 +64,8 @@ class Machine(Base):
 
     flags = relationship("Flag", back_populates="machine", cascade="all, delete-orphan")
     submissions = relationship("Submission", back_populates="machine")
+    # Only loaded where a query asks for it with active_user_count(Machine)
+    active_user_count = query_expression()
     active_users = relationship("User", secondary=active_machines_association, back_populates="active_machines")
 
 
@@ -69,13 +81,15 @@ class Flag(Base):
 
 class Submission(Base):
     __tablename__ = "submissions"
+    # A flag is scored once per user; the submit handler relies on this to detect repeats
+    __table_args__ = (UniqueConstraint("user_id", "flag_id", name="uq_submissions_user_flag"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     machine_id = Column(Integer, ForeignKey("machines.id"))
     flag_id = Column(Integer, ForeignKey("flags.id")) 
     flag = Column(String)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     user = relationship("User", back_populates="submissions")
     machine = relationship("Machine", back_populates="submissions")
@@ -107,11 +121,24 @@ class Challenge(Base):
     # New fields for Docker integration
     docker_image = Column(String, nullable=True)
     ip_address = Column(String, nullable=True)
+    host = Column(String, nullable=True)
     is_deleted = Column(Boolean, default=False)
 
     submissions = relationship("ChallengeSubmission", back_populates="challenge")
     flags = relationship("ChallengeFlag", back_populates="challenge", cascade="all, delete-orphan")
     active_users = relationship("User", secondary=active_challenges_association, back_populates="active_challenges")
+    # Only loaded where a query asks for it with active_user_count(Challenge)
+    active_user_count = query_expression()
+
+def active_user_count(model):
+    """Loader option filling `active_user_count` with a correlated count, so list
+    queries need neither the active_users collection nor a query per row."""
+    association, key = {
+        Machine: (active_machines_association, "machine_id"),
+        Challenge: (active_challenges_association, "challenge_id"),
+    }[model]
+    count = select(func.count()).where(association.c[key] == model.id).scalar_subquery()
+    return with_expression(model.active_user_count, count)
 
 class ChallengeFlag(Base):
     __tablename__ = "challenge_flags"
@@ -125,6 +152,13 @@ class ChallengeFlag(Base):
 
 class ChallengeSubmission(Base):
     __tablename__ = "challenge_submissions"
+    # A flag is solved once per user; wrong guesses are not constrained
+    __table_args__ = (
+        Index(
+            "uq_challenge_submissions_user_flag_correct", "user_id", "challenge_flag_id",
+            unique=True, postgresql_where=text("is_correct"), sqlite_where=text("is_correct"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -132,7 +166,7 @@ class ChallengeSubmission(Base):
     challenge_flag_id = Column(Integer, ForeignKey("challenge_flags.id"), nullable=True) 
     submitted_flag = Column(String)
     is_correct = Column(Boolean, default=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     user = relationship("User")
     challenge = relationship("Challenge", back_populates="submissions")
@@ -146,4 +180,79 @@ class Announcement(Base):
     description = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+# An instance holds (or waits for) capacity in these statuses; scheduler.PENDING_STATUSES lists the same
+_PENDING_INSTANCE = "status IN ('queued', 'starting', 'running', 'stopping')"
+
+def _pending_instance_index(name: str, target_column: str) -> Index:
+    where = text(f"{target_column} IS NOT NULL AND {_PENDING_INSTANCE}")
+    return Index(name, "user_id", target_column, unique=True, postgresql_where=where, sqlite_where=where)
+
+class Instance(Base):
+    __tablename__ = "instances"
+    # One live instance per user and target, so a double-click or a retry cannot queue a second
+    __table_args__ = (
+        _pending_instance_index("uq_instances_user_machine_pending", "machine_id"),
+        _pending_instance_index("uq_instances_user_challenge_pending", "challenge_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=True)
+    challenge_id = Column(Integer, ForeignKey("challenges.id"), nullable=True)
+    container_name = Column(String, nullable=True)
+    ip_address = Column(String, nullable=True)
+    host = Column(String, nullable=True)
+    # queued -> starting -> running -> stopping -> stopped, or failed
+    status = Column(String, default="queued", index=True)
+    cpu = Column(Float, default=0.5)
+    memory_mb = Column(Integer, default=256)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+    user = relationship("User")
+    machine = relationship("Machine")
+    challenge = relationship("Challenge")
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Either a single token (jti) or every token a user was issued before revoked_at
+    jti = Column(String, unique=True, nullable=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), index=True)
+
+class UserScore(Base):
+    __tablename__ = "user_scores"
+
+    # One row per user with at least one solve, kept current by the submission handlers
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    score = Column(Integer, default=0, nullable=False)
+    machine_flags = Column(Integer, default=0, nullable=False)
+    challenge_solves = Column(Integer, default=0, nullable=False)
+    last_solve_at = Column(DateTime(timezone=True), nullable=True)
+
+    user = relationship("User")
 
+class DailyRegistration(Base):
+    __tablename__ = "daily_registrations"
+
+    # Rollups are rebuilt from the raw tables by rollups.py; never written by handlers
+    day = Column(Date, primary_key=True)
+    users = Column(Integer, default=0, nullable=False)
+
+class DailyActivity(Base):
+    __tablename__ = "daily_activity"
+
+    day = Column(Date, primary_key=True)
+    target_type = Column(String, primary_key=True)  # "machine" or "challenge"
+    target_id = Column(Integer, primary_key=True)
+    submissions = Column(Integer, default=0, nullable=False)
+    correct = Column(Integer, default=0, nullable=False)
+    # Users whose first submission / first correct submission on the target fell on this day,
+    # so a sum over any range of days counts each user once
+    new_attempters = Column(Integer, default=0, nullable=False)
+    new_solvers = Column(Integer, default=0, nullable=False)
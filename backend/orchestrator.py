@@ -0,0 +1,334 @@
+import asyncio
+import os
+import threading
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import containers, database, events, models, placement, resources
+from cache import response_cache
+
+ORCHESTRATOR_WORKERS = int(os.getenv("ORCHESTRATOR_WORKERS", "4"))
+JOB_HISTORY_LIMIT = int(os.getenv("ORCHESTRATOR_JOB_HISTORY", "1000"))
+
+
+class Job:
+    def __init__(self, action: str, target_type: str, target_id: int, user_id: int | None = None, params: dict | None = None):
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.target_type = target_type
+        self.target_id = target_id
+        self.user_id = user_id
+        self.params = params or {}
+        self.done = asyncio.Event()
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+
+
+class Orchestrator:
+    """Runs container lifecycle jobs on a bounded set of async workers.
+
+    Docker calls are blocking, so each job runs in a worker thread while the
+    request that submitted it returns straight away with the job id. Jobs for
+    the same target are serialized so two starts never race on one container:
+    a job whose target is busy is parked on that target's backlog rather than
+    holding a worker, and goes back on the queue when the running one finishes.
+    """
+
+    def __init__(self, workers: int = ORCHESTRATOR_WORKERS, history_limit: int = JOB_HISTORY_LIMIT):
+        self.workers = workers
+        self.history_limit = history_limit
+        self._handlers = {}
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        # (target_type, target_id) -> id of the job holding it, and the jobs parked behind it.
+        # Only touched on the loop thread; targets leave both maps once their backlog is empty.
+        self._holders = {}
+        self._backlogs = {}
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+
+    def handler(self, target_type: str, action: str):
+        def decorator(fn):
+            self._handlers[(target_type, action)] = fn
+            return fn
+        return decorator
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, action: str, target_type: str, target_id: int, user_id: int | None = None, params: dict | None = None) -> Job:
+        if (target_type, action) not in self._handlers:
+            raise ValueError(f"No handler registered for {target_type} {action}")
+        if self._loop is None:
+            raise RuntimeError("Orchestrator has not been started")
+
+        job = Job(action, target_type, target_id, user_id, params)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history_limit:
+                oldest_id, oldest = next(iter(self._jobs.items()))
+                if oldest.status in ("queued", "running"):
+                    break
+                self._jobs.pop(oldest_id)
+        # Sync endpoints run in the threadpool, so hand the job over to the loop thread.
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    async def wait(self, job: Job) -> Job:
+        await job.done.wait()
+        return job
+
+    def queue_depth(self) -> int:
+        if self._queue is None:
+            return 0
+        return self._queue.qsize() + sum(len(backlog) for backlog in self._backlogs.values())
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            target = (job.target_type, job.target_id)
+            try:
+                holder = self._holders.get(target)
+                if holder is not None and holder != job.id:
+                    self._backlogs[target].append(job)
+                    continue
+                self._holders[target] = job.id
+                self._backlogs.setdefault(target, deque())
+                try:
+                    await self._run(job)
+                finally:
+                    self._release(target)
+            finally:
+                self._queue.task_done()
+
+    def _release(self, target: tuple[str, int]):
+        backlog = self._backlogs[target]
+        if backlog:
+            # Hand the target straight to the next job, which waits its turn in the queue
+            next_job = backlog.popleft()
+            self._holders[target] = next_job.id
+            self._queue.put_nowait(next_job)
+        else:
+            del self._holders[target]
+            del self._backlogs[target]
+
+    async def _run(self, job: Job):
+        handler = self._handlers[(job.target_type, job.action)]
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        try:
+            job.result = await asyncio.to_thread(handler, job)
+            job.status = "succeeded"
+        except containers.ContainerError as e:
+            job.error = e.detail
+            job.status = "failed"
+        except Exception as e:
+            job.error = f"An unexpected error occurred during {job.action}: {e}"
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.utcnow()
+            job.done.set()
+            # Container jobs change the IPs and active users that cached listings show
+            response_cache.invalidate(f"{job.target_type}s")
+            # Lets the submitting client stop polling /jobs/{id}; system jobs have nobody to tell
+            if job.user_id is not None:
+                events.event_hub.publish("job", {
+                    "id": job.id,
+                    "action": job.action,
+                    "target_type": job.target_type,
+                    "target_id": job.target_id,
+                    "status": job.status,
+                    "result": job.result,
+                    "error": job.error,
+                }, user_id=job.user_id)
+
+
+orchestrator = Orchestrator()
+
+
+def _ensure_machine_running(db, db_machine: models.Machine) -> str:
+    if db_machine.ip_address is not None:
+        return db_machine.ip_address
+    try:
+        ip_address, host = placement.start_container(
+            db,
+            db_machine.source_identifier,
+            containers.machine_container_name(db_machine.id),
+            profile=resources.machine_profile(db_machine)
+        )
+    except Exception:
+        db_machine.ip_address = None
+        db_machine.host = None
+        db.commit()
+        raise
+    db_machine.ip_address = ip_address
+    db_machine.host = host
+    db.commit()
+    return ip_address
+
+
+def _ensure_challenge_running(db, db_challenge: models.Challenge) -> str:
+    if db_challenge.ip_address is not None:
+        return db_challenge.ip_address
+    ip_address, host = placement.start_container(db, db_challenge.docker_image, containers.challenge_container_name(db_challenge), publish_ports=False)
+    db_challenge.ip_address = ip_address
+    db_challenge.host = host
+    db.commit()
+    return ip_address
+
+
+def _add_active_users(db, target, user_ids: list[int]) -> int:
+    if not user_ids:
+        return 0
+    users = db.query(models.User).filter(models.User.id.in_(user_ids)).all()
+    for user in users:
+        if user not in target.active_users:
+            target.active_users.append(user)
+    db.commit()
+    return len(users)
+
+
+@orchestrator.handler("machine", "start")
+def start_machine_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        db_machine = db.query(models.Machine).filter(models.Machine.id == job.target_id).first()
+        if not db_machine:
+            raise containers.ContainerError("Machine not found", status_code=404)
+
+        ip_address = _ensure_machine_running(db, db_machine)
+
+        # Adding the user to the list of active users
+        user = db.query(models.User).filter(models.User.id == job.user_id).first()
+        if user is not None and user not in db_machine.active_users:
+            db_machine.active_users.append(user)
+            db.commit()
+
+        return {"message": f"Machine {db_machine.name} is active for you with IP {ip_address}", "ip_address": ip_address}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("machine", "stop")
+def stop_machine_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        db_machine = db.query(models.Machine).filter(models.Machine.id == job.target_id).first()
+        if not db_machine:
+            raise containers.ContainerError("Machine not found", status_code=404)
+
+        user = db.query(models.User).filter(models.User.id == job.user_id).first()
+        if user is None or user not in db_machine.active_users:
+            return {"message": "Machine is no longer active for you."}
+        db_machine.active_users.remove(user)
+        db.commit()
+
+        if db_machine.active_users:
+            return {"message": f"Machine {db_machine.name} is no longer active for you, but remains running for other users."}
+
+        containers.teardown_container(
+            containers.machine_container_name(db_machine.id),
+            containers.stop_timeout_from_config(db_machine.config_json),
+            host=db_machine.host
+        )
+        db_machine.ip_address = None
+        db_machine.host = None
+        db.commit()
+        return {"message": f"Machine {db_machine.name} stopped globally."}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("machine", "restart")
+def restart_machine_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        db_machine = db.query(models.Machine).filter(models.Machine.id == job.target_id).first()
+        if not db_machine:
+            raise containers.ContainerError("Machine not found", status_code=404)
+
+        # The old container winds down in the background while the replacement starts.
+        container_name = containers.machine_container_name(db_machine.id)
+        if db_machine.ip_address is not None:
+            containers.teardown_container(container_name, containers.stop_timeout_from_config(db_machine.config_json), host=db_machine.host)
+
+        db_machine.active_users.clear()
+        db_machine.ip_address = None
+        db_machine.host = None
+        db.commit()
+
+        # Placed afresh, so a restart can move the machine off a busy host
+        ip_address = _ensure_machine_running(db, db_machine)
+        return {"message": f"Machine {db_machine.name} has been restarted successfully. New IP is {ip_address}.", "ip_address": ip_address}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("machine", "reap")
+def reap_machine_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        db_machine = db.query(models.Machine).filter(models.Machine.id == job.target_id).first()
+        if db_machine is None or db_machine.ip_address is None or db_machine.active_users:
+            return {"message": "Machine is still in use."}
+        containers.teardown_container(
+            containers.machine_container_name(db_machine.id),
+            containers.stop_timeout_from_config(db_machine.config_json),
+            host=db_machine.host
+        )
+        db_machine.ip_address = None
+        db_machine.host = None
+        db.commit()
+        return {"message": f"Machine {db_machine.name} stopped after its last lease expired."}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("challenge", "reap")
+def reap_challenge_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        db_challenge = db.query(models.Challenge).filter(models.Challenge.id == job.target_id).first()
+        if db_challenge is None or db_challenge.ip_address is None or db_challenge.active_users:
+            return {"message": "Challenge is still in use."}
+        containers.teardown_container(containers.challenge_container_name(db_challenge), host=db_challenge.host)
+        db_challenge.ip_address = None
+        db_challenge.host = None
+        db.commit()
+        return {"message": f"Challenge {db_challenge.title} stopped after its last lease expired."}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("challenge", "provision")
+def provision_challenge_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        db_challenge = db.query(models.Challenge).filter(models.Challenge.id == job.target_id).first()
+        if not db_challenge:
+            raise containers.ContainerError("Challenge not found", status_code=404)
+        if not db_challenge.docker_image:
+            raise containers.ContainerError("Challenge does not have a Docker image configured.", status_code=400)
+        ip_address = _ensure_challenge_running(db, db_challenge)
+        users = _add_active_users(db, db_challenge, job.params.get("user_ids", []))
+        return {"message": f"Challenge {db_challenge.title} is running with IP {ip_address} for {users} users.", "ip_address": ip_address}
+    finally:
+        db.close()
@@ -0,0 +1,128 @@
+import os
+
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+import models, resources, schemas, warm_pool
+from docker_manager import DEFAULT_DOCKER_HOST, docker_hosts, for_host
+
+SCHEDULER_HOST_CPU = float(os.getenv("SCHEDULER_HOST_CPU", str(os.cpu_count() or 4)))
+SCHEDULER_HOST_MEMORY_MB = int(os.getenv("SCHEDULER_HOST_MEMORY_MB", "8192"))
+# Budgets for hosts that differ from the defaults above, e.g. "edge-1=16:32768"
+SCHEDULER_HOST_CAPACITY = os.getenv("SCHEDULER_HOST_CAPACITY", "")
+
+# Instances in these states hold a reservation against host capacity.
+ACTIVE_STATUSES = ("starting", "running", "stopping")
+
+
+class Host:
+    def __init__(self, name: str, cpu: float, memory_mb: int):
+        self.name = name
+        self.cpu = cpu
+        self.memory_mb = memory_mb
+
+
+def _parse_capacity(spec: str) -> dict:
+    capacity = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, budget = item.split("=", 1)
+        cpu, memory_mb = budget.split(":", 1)
+        capacity[name.strip()] = (float(cpu), int(memory_mb))
+    return capacity
+
+
+_capacity = _parse_capacity(SCHEDULER_HOST_CAPACITY)
+hosts = [Host(name, *_capacity.get(name, (SCHEDULER_HOST_CPU, SCHEDULER_HOST_MEMORY_MB))) for name in docker_hosts]
+
+
+def shared_usage(db: Session) -> dict:
+    """CPU/memory per host held by containers that do not go through the instance queue."""
+    shared = {}
+
+    def add(host, kind, profile, count=1):
+        entry = shared.setdefault(host or DEFAULT_DOCKER_HOST, {"machines": [0.0, 0], "challenges": [0.0, 0], "warm_pool": [0.0, 0]})
+        entry[kind][0] += profile.cpus * count
+        entry[kind][1] += profile.memory_mb * count
+
+    running_machines = db.query(models.Machine.host, models.Machine.config_json).filter(models.Machine.ip_address.isnot(None)).all()
+    for host, config_json in running_machines:
+        add(host, "machines", resources.profile_from_config(config_json))
+    running_challenges = db.query(models.Challenge.host, func.count(models.Challenge.id)).filter(
+        models.Challenge.ip_address.isnot(None)
+    ).group_by(models.Challenge.host).all()
+    default = resources.default_profile()
+    for host, count in running_challenges:
+        add(host, "challenges", default, count)
+    for host, profile, idle in warm_pool.warm_pool.reserved():
+        add(host, "warm_pool", resources.resolve(profile), idle)
+    return shared
+
+
+def usage(db: Session) -> dict:
+    """CPU/memory reserved on each host by instances and shared containers."""
+    usage = {host.name: [0.0, 0] for host in hosts}
+    rows = db.query(
+        models.Instance.host,
+        func.coalesce(func.sum(models.Instance.cpu), 0),
+        func.coalesce(func.sum(models.Instance.memory_mb), 0)
+    ).filter(models.Instance.status.in_(ACTIVE_STATUSES)).group_by(models.Instance.host).all()
+    for host, cpu, memory_mb in rows:
+        entry = usage.setdefault(host or DEFAULT_DOCKER_HOST, [0.0, 0])
+        entry[0] += float(cpu)
+        entry[1] += int(memory_mb)
+    for host, kinds in shared_usage(db).items():
+        entry = usage.setdefault(host, [0.0, 0])
+        for kind, (cpu, memory_mb) in kinds.items():
+            # Idle warm containers are handed to the next start, so they hold nothing against it.
+            if kind == "warm_pool":
+                continue
+            entry[0] += cpu
+            entry[1] += memory_mb
+    return usage
+
+
+def locality(host: str, image_name: str) -> int:
+    """2 if a warm container of the image is idle on `host`, 1 if the image is pulled, else 0."""
+    if warm_pool.warm_pool.has_idle(host, image_name):
+        return 2
+    return 1 if for_host(host).has_image(image_name) else 0
+
+
+def choose_host(candidates: list[Host], usage: dict, cpu: float, memory_mb: int, image_name: str, locality_cache: dict | None = None) -> str | None:
+    """Pick a host that fits: image locality first, then the most free memory."""
+    fitting = [
+        host for host in candidates
+        if usage.get(host.name, [0.0, 0])[0] + cpu <= host.cpu and usage.get(host.name, [0.0, 0])[1] + memory_mb <= host.memory_mb
+    ]
+    if not fitting:
+        return None
+    if len(fitting) == 1:
+        return fitting[0].name
+    cache = locality_cache if locality_cache is not None else {}
+
+    def score(host):
+        key = (host.name, image_name)
+        if key not in cache:
+            cache[key] = locality(host.name, image_name)
+        return cache[key], host.memory_mb - usage.get(host.name, [0.0, 0])[1]
+
+    return max(fitting, key=score).name
+
+
+def place(db: Session, image_name: str, profile: schemas.ResourceProfile) -> str:
+    # Shared containers are not queued, so when nothing fits the least loaded host takes it.
+    current = usage(db)
+    host = choose_host(hosts, current, profile.cpus, profile.memory_mb, image_name)
+    if host is None:
+        host = max(hosts, key=lambda h: h.memory_mb - current.get(h.name, [0.0, 0])[1]).name
+    return host
+
+
+def start_container(db: Session, image_name: str, container_name: str, publish_ports: bool = True, profile: schemas.ResourceProfile | None = None) -> tuple[str, str]:
+    """Place a shared machine/challenge container and start it; returns (ip_address, host)."""
+    profile = resources.resolve(profile)
+    host = place(db, image_name, profile)
+    ip_address = warm_pool.start_container(image_name, container_name, publish_ports=publish_ports, profile=profile, host=host)
+    return ip_address, host
@@ -0,0 +1,87 @@
+import json
+import os
+
+from pydantic import ValidationError
+
+import schemas
+
+RESOURCE_DEFAULT_CPUS = float(os.getenv("RESOURCE_DEFAULT_CPUS", "0.5"))
+RESOURCE_DEFAULT_MEMORY_MB = int(os.getenv("RESOURCE_DEFAULT_MEMORY_MB", "256"))
+RESOURCE_DEFAULT_PIDS_LIMIT = int(os.getenv("RESOURCE_DEFAULT_PIDS_LIMIT", "256"))
+RESOURCE_DEFAULT_READ_ONLY = os.getenv("RESOURCE_DEFAULT_READ_ONLY", "false").lower() == "true"
+# Scratch mounts, e.g. "/tmp:size=64m;/run" - read-only labs usually need a few
+RESOURCE_DEFAULT_TMPFS = os.getenv("RESOURCE_DEFAULT_TMPFS", "")
+CONTAINER_STOP_TIMEOUT = int(os.getenv("CONTAINER_STOP_TIMEOUT", "10"))
+
+
+def _parse_tmpfs(spec: str) -> dict:
+    mounts = {}
+    for item in spec.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        path, _, options = item.partition(":")
+        mounts[path] = options
+    return mounts
+
+
+def default_profile() -> schemas.ResourceProfile:
+    return schemas.ResourceProfile(
+        cpus=RESOURCE_DEFAULT_CPUS,
+        memory_mb=RESOURCE_DEFAULT_MEMORY_MB,
+        pids_limit=RESOURCE_DEFAULT_PIDS_LIMIT,
+        tmpfs=_parse_tmpfs(RESOURCE_DEFAULT_TMPFS),
+        read_only=RESOURCE_DEFAULT_READ_ONLY,
+        stop_timeout=CONTAINER_STOP_TIMEOUT,
+    )
+
+
+def parse_config(config_json: str | None) -> schemas.ResourceProfile:
+    """Validate the resource keys of a machine's config_json; unset keys stay None."""
+    config = json.loads(config_json) if config_json else {}
+    if not isinstance(config, dict):
+        raise ValueError("config_json must be a JSON object")
+    return schemas.ResourceProfile.model_validate(config)
+
+
+def resolve(profile: schemas.ResourceProfile | None) -> schemas.ResourceProfile:
+    """Fill the keys a profile leaves unset with the platform defaults."""
+    defaults = default_profile()
+    if profile is None:
+        return defaults
+    overrides = profile.model_dump(exclude_none=True)
+    return defaults.model_copy(update=overrides)
+
+
+def profile_from_config(config_json: str | None) -> schemas.ResourceProfile:
+    try:
+        return resolve(parse_config(config_json))
+    except (ValueError, ValidationError) as e:
+        # Rows written before config_json was validated; run them on the defaults.
+        print(f"Ignoring invalid resource profile in config_json: {e}")
+        return default_profile()
+
+
+def machine_profile(machine) -> schemas.ResourceProfile:
+    return profile_from_config(machine.config_json)
+
+
+def docker_options(profile: schemas.ResourceProfile) -> dict:
+    """Keyword arguments for `containers.run` that enforce a resolved profile."""
+    options = {
+        "nano_cpus": int(profile.cpus * 1_000_000_000),
+        "mem_limit": f"{profile.memory_mb}m",
+        # Same value as mem_limit, so the container cannot spill into swap
+        "memswap_limit": f"{profile.memory_mb}m",
+        "pids_limit": profile.pids_limit,
+        "read_only": profile.read_only,
+    }
+    if profile.tmpfs:
+        options["tmpfs"] = dict(profile.tmpfs)
+    return options
+
+
+def profile_key(profile: schemas.ResourceProfile) -> str:
+    """Stable identity of the limits a container was started with."""
+    # The stop timeout only matters at teardown, so it does not split warm pools.
+    return profile.model_dump_json(exclude={"stop_timeout"})
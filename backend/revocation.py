@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import math
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import database, models
+
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "10"))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+# How far back each sync re-reads; covers rows committed after later-stamped ones
+REVOCATION_SYNC_OVERLAP = float(os.getenv("REVOCATION_SYNC_OVERLAP", "60"))
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray(math.ceil(self.size / 8))
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    """Revoked token ids and per-user cut-offs, checked in memory on every request.
+
+    Nearly every token was never revoked, and the Bloom filter answers that
+    without consulting the exact set; a hit is confirmed against the exact set
+    so false positives never lock anyone out. Revocations are written to the
+    revoked_tokens table, and `sync` pulls rows written by other workers.
+
+    `sync` re-reads every row revoked since its previous pass minus an overlap,
+    rather than everything after the highest id seen: ids and timestamps are
+    assigned before commit, so rows from other workers can become visible out
+    of order. Applying a row twice is harmless.
+    """
+
+    def __init__(self, interval: float = REVOCATION_SYNC_INTERVAL, overlap: float = REVOCATION_SYNC_OVERLAP):
+        self.interval = interval
+        self.overlap = timedelta(seconds=overlap)
+        self._bloom = BloomFilter()
+        self._tokens = {}
+        self._users = {}
+        self._synced_through = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    def is_revoked(self, jti: str | None) -> bool:
+        if jti is None or jti not in self._bloom:
+            return False
+        with self._lock:
+            return jti in self._tokens
+
+    def issued_before_cutoff(self, user_id: int | None, issued_at: float | None) -> bool:
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is None:
+            return False
+        revoked_at, _ = entry
+        return (issued_at or 0) <= revoked_at
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime) -> bool:
+        """Revoke one token id; False if it was already revoked, here or by another worker."""
+        insert = database.dialect_insert(db.get_bind())
+        columns = (models.RevokedToken.jti, models.RevokedToken.user_id, models.RevokedToken.revoked_at, models.RevokedToken.expires_at)
+        row = db.execute(
+            insert(models.RevokedToken).values(jti=jti, expires_at=expires_at)
+            .on_conflict_do_nothing(index_elements=[models.RevokedToken.jti])
+            .returning(*columns)
+        ).first()
+        db.commit()
+        if row is None:
+            # Another worker revoked it first and this one has not synced yet
+            row = db.execute(select(*columns).where(models.RevokedToken.jti == jti)).one()
+            self._apply(row)
+            return False
+        self._apply(row)
+        return True
+
+    def revoke_user(self, db: Session, user_id: int, lifetime: timedelta):
+        """Reject every token the user holds that was issued before now."""
+        now = datetime.now(timezone.utc)
+        # Older tokens have all expired once `lifetime` has passed, so the cut-off can go then
+        row = models.RevokedToken(user_id=user_id, revoked_at=now, expires_at=now + lifetime)
+        db.add(row)
+        db.commit()
+        self._apply(row)
+
+    def sync(self, db: Session):
+        query = db.query(models.RevokedToken).filter(models.RevokedToken.expires_at > datetime.now(timezone.utc))
+        if self._synced_through is not None:
+            query = query.filter(models.RevokedToken.revoked_at >= self._synced_through - self.overlap)
+        rows = query.order_by(models.RevokedToken.id).all()
+        for row in rows:
+            self._apply(row)
+            revoked_at = _aware(row.revoked_at)
+            if self._synced_through is None or revoked_at > self._synced_through:
+                self._synced_through = revoked_at
+        self._prune()
+
+    def _apply(self, row):
+        expires_at = _aware(row.expires_at)
+        with self._lock:
+            if row.jti is not None:
+                self._tokens[row.jti] = expires_at
+                self._bloom.add(row.jti)
+            elif row.user_id is not None:
+                revoked_at = _aware(row.revoked_at).timestamp()
+                previous = self._users.get(row.user_id)
+                if previous is None or previous[0] < revoked_at:
+                    self._users[row.user_id] = (revoked_at, expires_at)
+
+    def _prune(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            expired = [jti for jti, expires_at in self._tokens.items() if expires_at <= now]
+            for jti in expired:
+                del self._tokens[jti]
+            for user_id in [user_id for user_id, (_, expires_at) in self._users.items() if expires_at <= now]:
+                del self._users[user_id]
+            if expired:
+                # Bloom filters cannot forget, so rebuild from what is left.
+                self._bloom = BloomFilter()
+                for jti in self._tokens:
+                    self._bloom.add(jti)
+
+    async def start(self):
+        await asyncio.to_thread(self._sync_once)
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self._sync_once)
+            except Exception as e:
+                print(f"Revocation sync failed: {e}")
+
+    def _sync_once(self):
+        db = database.SessionLocal()
+        try:
+            self.sync(db)
+        finally:
+            db.close()
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything here is UTC.
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+revocation_store = RevocationStore()
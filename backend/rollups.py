@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import Date, and_, delete, distinct, func, insert, select, update
+from sqlalchemy.orm import Session, aliased
+
+import database, models
+
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+# Days rebuilt on every pass; yesterday stays in so rows committed just before midnight are counted
+ROLLUP_TRAILING_DAYS = int(os.getenv("ROLLUP_TRAILING_DAYS", "2"))
+
+
+def midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def day_of(column):
+    # date() exists on both PostgreSQL and SQLite; typing it as Date parses SQLite's string
+    return func.date(column, type_=Date)
+
+
+def _first(table, target_column, correct=None):
+    """Rows that are the user's first (correct) submission on their target."""
+    earlier = aliased(table)
+    conditions = [
+        earlier.user_id == table.user_id,
+        getattr(earlier, target_column) == getattr(table, target_column),
+        earlier.created_at < table.created_at,
+    ]
+    if correct is not None:
+        conditions.append(getattr(earlier, correct) == True)
+    return ~select(earlier.id).where(*conditions).exists()
+
+
+def _activity(db: Session, target_type: str, table, target_column: str, since: date, correct_column=None) -> dict:
+    """Per (day, target) counts for one submissions table, from `since` on."""
+    day = day_of(table.created_at)
+    target = getattr(table, target_column)
+    window = and_(table.created_at >= midnight(since), target.isnot(None))
+    rows = {}
+
+    def merge(statement, field):
+        for bucket, target_id, count in db.execute(statement.group_by(day, target)).all():
+            if bucket is None:
+                continue
+            key = (bucket, target_type, target_id)
+            rows.setdefault(key, {
+                "day": bucket, "target_type": target_type, "target_id": target_id,
+                "submissions": 0, "correct": 0, "new_attempters": 0, "new_solvers": 0,
+            })[field] = count
+
+    merge(select(day, target, func.count(table.id)).where(window), "submissions")
+    merge(select(day, target, func.count(distinct(table.user_id))).where(window, _first(table, target_column)), "new_attempters")
+    if correct_column is None:
+        # Only correct machine flags are ever stored, so every submission is a solve
+        for entry in rows.values():
+            entry["correct"] = entry["submissions"]
+            entry["new_solvers"] = entry["new_attempters"]
+    else:
+        is_correct = getattr(table, correct_column) == True
+        merge(select(day, target, func.count(table.id)).where(window, is_correct), "correct")
+        merge(select(day, target, func.count(distinct(table.user_id))).where(window, is_correct, _first(table, target_column, correct_column)), "new_solvers")
+    return rows
+
+
+def rebuild(db: Session, since: date):
+    """Recompute every rollup row for `since` through today from the raw tables.
+
+    A day is always rebuilt whole, so running this again over the same days is
+    harmless; the aggregator does exactly that for the trailing days.
+    """
+    day = day_of(models.User.created_at)
+    registrations = [
+        {"day": bucket, "users": count}
+        for bucket, count in db.execute(
+            select(day, func.count(models.User.id))
+            .where(models.User.created_at >= midnight(since))
+            .group_by(day)
+        ).all()
+        if bucket is not None
+    ]
+    activity = {}
+    activity.update(_activity(db, "machine", models.Submission, "machine_id", since))
+    activity.update(_activity(db, "challenge", models.ChallengeSubmission, "challenge_id", since, correct_column="is_correct"))
+
+    db.execute(delete(models.DailyRegistration).where(models.DailyRegistration.day >= since))
+    db.execute(delete(models.DailyActivity).where(models.DailyActivity.day >= since))
+    if registrations:
+        db.execute(insert(models.DailyRegistration), registrations)
+    if activity:
+        db.execute(insert(models.DailyActivity), list(activity.values()))
+    db.commit()
+
+
+def forget_registration(db: Session, created_at: datetime | None):
+    """Take a deleted user out of their registration day, in the caller's transaction.
+
+    Days inside the aggregator's window are rebuilt anyway; older ones are not.
+    """
+    if created_at is None:
+        return
+    # SQLite hands back naive datetimes; everything here is UTC.
+    day = (created_at.astimezone(timezone.utc) if created_at.tzinfo is not None else created_at).date()
+    db.execute(
+        update(models.DailyRegistration)
+        .where(models.DailyRegistration.day == day, models.DailyRegistration.users > 0)
+        .values(users=models.DailyRegistration.users - 1)
+    )
+
+
+def earliest_day(db: Session) -> date | None:
+    days = [
+        db.scalar(select(func.min(day_of(column))))
+        for column in (models.User.created_at, models.Submission.created_at, models.ChallengeSubmission.created_at)
+    ]
+    days = [day for day in days if day is not None]
+    return min(days) if days else None
+
+
+class RollupAggregator:
+    """Keeps the daily rollup tables current for the analytics dashboard.
+
+    Each pass rebuilds the trailing days from the raw tables, which only reads
+    rows created in that window. Older days are filled in once by migration
+    7a4c2e9b1f38; `python rollups.py backfill` rebuilds any range on demand.
+    """
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL, trailing_days: int = ROLLUP_TRAILING_DAYS):
+        self.interval = interval
+        self.trailing_days = trailing_days
+        self.last_run = None
+        self._task = None
+
+    def run_once(self):
+        since = datetime.now(timezone.utc).date() - timedelta(days=self.trailing_days - 1)
+        db = database.SessionLocal()
+        try:
+            rebuild(db, since)
+        finally:
+            db.close()
+        self.last_run = datetime.now(timezone.utc)
+
+    async def start(self):
+        await asyncio.to_thread(self.run_once)
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                print(f"Rollup aggregation failed: {e}")
+
+
+rollup_aggregator = RollupAggregator()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the analytics rollup tables.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill = subcommands.add_parser("backfill", help="Rebuild rollups from the raw tables.")
+    backfill.add_argument("--since", type=date.fromisoformat, help="First day to rebuild (YYYY-MM-DD); defaults to the earliest recorded activity.")
+    args = parser.parse_args()
+
+    db = database.SessionLocal()
+    try:
+        since = args.since or earliest_day(db)
+        if since is None:
+            print("Nothing to backfill.")
+            return
+        rebuild(db, since)
+        print(f"Rebuilt rollups from {since.isoformat()}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
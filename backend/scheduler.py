@@ -0,0 +1,280 @@
+import os
+import threading
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+import containers, database, models, placement, resources, warm_pool
+from orchestrator import orchestrator, Job
+from placement import ACTIVE_STATUSES, Host
+
+SCHEDULER_GLOBAL_CPU = os.getenv("SCHEDULER_GLOBAL_CPU")
+SCHEDULER_GLOBAL_MEMORY_MB = os.getenv("SCHEDULER_GLOBAL_MEMORY_MB")
+SCHEDULER_MAX_INSTANCES_PER_USER = int(os.getenv("SCHEDULER_MAX_INSTANCES_PER_USER", "3"))
+
+PENDING_STATUSES = ("queued",) + ACTIVE_STATUSES
+
+
+class Scheduler:
+    """Admits per-user instances against global and per-host CPU/memory budgets.
+
+    Requests that do not fit wait in a FIFO queue kept in the instances table
+    (status "queued", ordered by id), so the queue survives a restart and a
+    request's position is a single count query. Shared machine/challenge
+    containers are not queued, but their resource profiles still count
+    against the host they run on.
+    """
+
+    def __init__(self, hosts: list[Host], global_cpu: float | None = None, global_memory_mb: int | None = None):
+        self.hosts = {host.name: host for host in hosts}
+        self.global_cpu = global_cpu if global_cpu is not None else sum(h.cpu for h in hosts)
+        self.global_memory_mb = global_memory_mb if global_memory_mb is not None else sum(h.memory_mb for h in hosts)
+        self._lock = threading.Lock()
+
+    def usage(self, db: Session) -> dict:
+        usage = placement.usage(db)
+        for name in self.hosts:
+            usage.setdefault(name, [0.0, 0])
+        return usage
+
+    def _place(self, usage: dict, instance: models.Instance, locality_cache: dict) -> str | None:
+        used_cpu = sum(cpu for cpu, _ in usage.values())
+        used_memory = sum(memory for _, memory in usage.values())
+        if used_cpu + instance.cpu > self.global_cpu or used_memory + instance.memory_mb > self.global_memory_mb:
+            return None
+        image_name, _ = _instance_image(instance)
+        return placement.choose_host(list(self.hosts.values()), usage, instance.cpu, instance.memory_mb, image_name, locality_cache)
+
+    def _pending(self, db: Session, user_id: int, machine: models.Machine | None, challenge: models.Challenge | None) -> models.Instance | None:
+        return db.query(models.Instance).filter(
+            models.Instance.user_id == user_id,
+            models.Instance.status.in_(PENDING_STATUSES),
+            models.Instance.machine_id == (machine.id if machine else None),
+            models.Instance.challenge_id == (challenge.id if challenge else None)
+        ).first()
+
+    def _enqueue(self, db: Session, user_id: int, machine: models.Machine | None, challenge: models.Challenge | None) -> models.Instance:
+        """Queue an instance, or return the one a concurrent request for the same target just queued."""
+        instance = models.Instance(
+            user_id=user_id,
+            machine_id=machine.id if machine else None,
+            challenge_id=challenge.id if challenge else None,
+            status="queued"
+        )
+        profile = resources.machine_profile(machine) if machine else resources.default_profile()
+        instance.cpu = profile.cpus
+        instance.memory_mb = profile.memory_mb
+        db.add(instance)
+        try:
+            db.commit()
+        except IntegrityError:
+            # uq_instances_user_*_pending: the other request got there first
+            db.rollback()
+            return self._pending(db, user_id, machine, challenge)
+        return instance
+
+    def request_instance(self, db: Session, user: models.User, machine: models.Machine | None = None, challenge: models.Challenge | None = None) -> models.Instance:
+        existing = self._pending(db, user.id, machine, challenge)
+        if existing is not None:
+            return existing
+        running = db.query(models.Instance).filter(
+            models.Instance.user_id == user.id,
+            models.Instance.status.in_(PENDING_STATUSES)
+        ).count()
+        if running >= SCHEDULER_MAX_INSTANCES_PER_USER:
+            raise HTTPException(status_code=429, detail=f"You can run at most {SCHEDULER_MAX_INSTANCES_PER_USER} instances at a time.")
+
+        instance = self._enqueue(db, user.id, machine, challenge)
+        self.admit(db)
+        db.refresh(instance)
+        return instance
+
+    def provision(self, db: Session, machine: models.Machine, user_ids: list[int]) -> list[models.Instance]:
+        """Queue an instance of `machine` for each user who has none yet, then admit what fits.
+
+        Admins provision for a whole class, so the per-user instance limit does not apply.
+        """
+        users = db.query(models.User.id).filter(models.User.id.in_(user_ids)).order_by(models.User.id).all()
+        instances = []
+        for (user_id,) in users:
+            instance = self._pending(db, user_id, machine, None)
+            instances.append(instance if instance is not None else self._enqueue(db, user_id, machine, None))
+        self.admit(db)
+        for instance in instances:
+            db.refresh(instance)
+        return instances
+
+    def admit(self, db: Session):
+        """Start queued instances in FIFO order until the head no longer fits."""
+        admitted = []
+        with self._lock:
+            usage = self.usage(db)
+            locality_cache = {}
+            queued = db.query(models.Instance).filter(models.Instance.status == "queued").order_by(models.Instance.id).all()
+            for instance in queued:
+                host = self._place(usage, instance, locality_cache)
+                if host is None:
+                    break
+                instance.host = host
+                instance.status = "starting"
+                instance.container_name = instance_container_name(instance.id)
+                usage[host][0] += instance.cpu
+                usage[host][1] += instance.memory_mb
+                admitted.append((instance.id, instance.user_id))
+            db.commit()
+        # Owned by the player, so the job's completion is pushed to them
+        for instance_id, user_id in admitted:
+            orchestrator.submit("start", "instance", instance_id, user_id=user_id)
+
+    def resume(self, db: Session):
+        """Re-submit jobs lost with the previous process, then drain the queue."""
+        pending = db.query(models.Instance).filter(models.Instance.status.in_(("starting", "stopping"))).all()
+        for instance in pending:
+            orchestrator.submit("start" if instance.status == "starting" else "stop", "instance", instance.id)
+        self.admit(db)
+
+    def queue_position(self, db: Session, instance: models.Instance) -> int | None:
+        if instance.status != "queued":
+            return None
+        return db.query(models.Instance).filter(
+            models.Instance.status == "queued",
+            models.Instance.id <= instance.id
+        ).count()
+
+    def capacity(self, db: Session) -> dict:
+        usage = self.usage(db)
+        shared = {"machines": [0.0, 0], "challenges": [0.0, 0], "warm_pool": [0.0, 0]}
+        for kinds in placement.shared_usage(db).values():
+            for kind, (cpu, memory_mb) in kinds.items():
+                shared[kind][0] += cpu
+                shared[kind][1] += memory_mb
+        cpu_reserved = sum(cpu for cpu, _ in usage.values())
+        memory_mb_reserved = sum(memory for _, memory in usage.values())
+        hosts = [
+            {
+                "name": host.name,
+                "cpu_reserved": usage[host.name][0],
+                "cpu_total": host.cpu,
+                "memory_mb_reserved": usage[host.name][1],
+                "memory_mb_total": host.memory_mb,
+            }
+            for host in self.hosts.values()
+        ]
+        return {
+            "cpu_reserved": cpu_reserved,
+            "cpu_available": max(0.0, self.global_cpu - cpu_reserved),
+            "cpu_total": self.global_cpu,
+            "memory_mb_reserved": memory_mb_reserved,
+            "memory_mb_available": max(0, self.global_memory_mb - memory_mb_reserved),
+            "memory_mb_total": self.global_memory_mb,
+            # Idle warm containers are listed for visibility but are not counted as reserved
+            "shared": {kind: {"cpu": cpu, "memory_mb": memory_mb} for kind, (cpu, memory_mb) in shared.items()},
+            "queued": db.query(models.Instance).filter(models.Instance.status == "queued").count(),
+            "hosts": hosts,
+        }
+
+
+scheduler = Scheduler(
+    placement.hosts,
+    global_cpu=float(SCHEDULER_GLOBAL_CPU) if SCHEDULER_GLOBAL_CPU else None,
+    global_memory_mb=int(SCHEDULER_GLOBAL_MEMORY_MB) if SCHEDULER_GLOBAL_MEMORY_MB else None,
+)
+
+
+def instance_container_name(instance_id: int) -> str:
+    return f"instance-{instance_id}"
+
+
+def _instance_image(instance: models.Instance) -> tuple[str, bool]:
+    if instance.machine_id is not None:
+        return instance.machine.source_identifier, True
+    # Challenges expose their services on the internal network only
+    return instance.challenge.docker_image, False
+
+
+def _instance_profile(instance: models.Instance):
+    if instance.machine_id is not None:
+        return resources.machine_profile(instance.machine)
+    return resources.default_profile()
+
+
+def _instance_stop_timeout(instance: models.Instance) -> int:
+    return _instance_profile(instance).stop_timeout
+
+
+def _launch(db: Session, instance: models.Instance):
+    image_name, publish_ports = _instance_image(instance)
+    # Run with the limits that were reserved when the instance was queued
+    profile = _instance_profile(instance).model_copy(update={"cpus": instance.cpu, "memory_mb": instance.memory_mb})
+    try:
+        instance.ip_address = warm_pool.start_container(
+            image_name,
+            instance.container_name,
+            publish_ports=publish_ports,
+            profile=profile,
+            host=instance.host
+        )
+    except Exception as e:
+        instance.status = "failed"
+        instance.error = str(e)
+        instance.ip_address = None
+        db.commit()
+        # The reservation is gone, so whoever is next in line may now fit.
+        scheduler.admit(db)
+        raise
+    instance.status = "running"
+    instance.error = None
+    instance.started_at = func.now()
+    instance.expires_at = models.lease_expiry()
+    db.commit()
+
+
+@orchestrator.handler("instance", "start")
+def start_instance_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        instance = db.query(models.Instance).filter(models.Instance.id == job.target_id).first()
+        if instance is None or instance.status != "starting":
+            return {"message": "Instance is no longer waiting to start."}
+        _launch(db, instance)
+        return {"message": f"Instance {instance.id} is running with IP {instance.ip_address}", "ip_address": instance.ip_address}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("instance", "stop")
+def stop_instance_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        instance = db.query(models.Instance).filter(models.Instance.id == job.target_id).first()
+        if instance is None:
+            return {"message": "Instance not found."}
+        if instance.container_name:
+            containers.teardown_container(instance.container_name, _instance_stop_timeout(instance), host=instance.host)
+        instance.status = "stopped"
+        instance.ip_address = None
+        db.commit()
+        scheduler.admit(db)
+        return {"message": f"Instance {instance.id} stopped."}
+    finally:
+        db.close()
+
+
+@orchestrator.handler("instance", "restart")
+def restart_instance_job(job: Job):
+    db = database.SessionLocal()
+    try:
+        instance = db.query(models.Instance).filter(models.Instance.id == job.target_id).first()
+        if instance is None or instance.status != "running":
+            return {"message": "Instance is not running."}
+        # Flip the status first so the container's die event is not taken for a crash
+        instance.status = "starting"
+        instance.ip_address = None
+        db.commit()
+        containers.teardown_container(instance.container_name, _instance_stop_timeout(instance), host=instance.host)
+        _launch(db, instance)
+        return {"message": f"Instance {instance.id} has been restarted successfully. New IP is {instance.ip_address}.", "ip_address": instance.ip_address}
+    finally:
+        db.close()
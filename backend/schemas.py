@@ -1,6 +1,7 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from datetime import datetime
 from fastapi import HTTPException
+import json
 
 class UserBase(BaseModel):
     username: str
@@ -26,6 +27,14 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+# Who is playing a machine or challenge, as shown to other players
+class ActiveUser(BaseModel):
+    id: int
+    username: str
+
+    class Config:
+        from_attributes = True
+
 class UserUpdate(BaseModel):
     role: str
 
@@ -42,6 +51,22 @@ class Flag(FlagBase):
     class Config:
         from_attributes = True
 
+class ResourceProfile(BaseModel):
+    # Keys left as None fall back to the platform defaults in resources.py
+    cpus: float | None = Field(default=None, gt=0, le=64)
+    memory_mb: int | None = Field(default=None, ge=16, le=262144)
+    pids_limit: int | None = Field(default=None, ge=16, le=65536)
+    tmpfs: dict[str, str] | None = None
+    read_only: bool | None = None
+    stop_timeout: int | None = Field(default=None, ge=0, le=600)
+
+    @field_validator('tmpfs')
+    @classmethod
+    def validate_tmpfs_paths(cls, v: dict[str, str] | None) -> dict[str, str] | None:
+        if v is not None and any(not path.startswith('/') for path in v):
+            raise ValueError('tmpfs mount points must be absolute paths')
+        return v
+
 class MachineBase(BaseModel):
     name: str
     description: str | None = None
@@ -58,13 +83,48 @@ class MachineBase(BaseModel):
     status: str = "upcoming"
 
 class MachineCreate(MachineBase):
-    pass
+
+    @field_validator('config_json')
+    @classmethod
+    def validate_resource_profile(cls, v: str | None) -> str | None:
+        if not v:
+            return v
+        try:
+            config = json.loads(v)
+        except ValueError:
+            raise HTTPException(status_code=422, detail='config_json must be valid JSON')
+        if not isinstance(config, dict):
+            raise HTTPException(status_code=422, detail='config_json must be a JSON object')
+        try:
+            ResourceProfile.model_validate(config)
+        except ValidationError as e:
+            errors = '; '.join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+            raise HTTPException(status_code=422, detail=f'Invalid resource profile in config_json: {errors}')
+        return v
 
 class Machine(MachineBase):
     id: int
     ip_address: str | None = None
+    host: str | None = None
+    is_deleted: bool
+    active_users: list[ActiveUser] = []
+
+    class Config:
+        from_attributes = True
+
+# List views get no flags or player details, only how many are playing
+class MachineSummary(BaseModel):
+    id: int
+    name: str
+    description: str | None = None
+    category: str | None = None
+    difficulty: str | None = None
+    operating_system: str | None = None
+    solves: int = 0
+    status: str = "upcoming"
+    release_date: datetime | None = None
     is_deleted: bool
-    active_users: list[User] = []
+    active_user_count: int
 
     class Config:
         from_attributes = True
@@ -134,8 +194,24 @@ class Challenge(ChallengeBase):
     id: int
     created_at: datetime
     ip_address: str | None = None 
+    host: str | None = None
     is_deleted: bool
     flags: list[ChallengeFlag] = [] 
+    active_users: list[ActiveUser] = []
+    class Config:
+        from_attributes = True
+
+class ChallengeSummary(BaseModel):
+    id: int
+    title: str
+    description: str
+    category: str
+    difficulty: str
+    points: int
+    created_at: datetime
+    is_deleted: bool
+    active_user_count: int
+
     class Config:
         from_attributes = True
 
@@ -174,3 +250,61 @@ class Announcement(AnnouncementBase):
     class Config:
         from_attributes = True
 
+
+class Job(BaseModel):
+    id: str
+    action: str
+    target_type: str
+    target_id: int
+    status: str
+    result: dict | None = None
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+class Instance(BaseModel):
+    id: int
+    user_id: int
+    machine_id: int | None = None
+    challenge_id: int | None = None
+    container_name: str | None = None
+    ip_address: str | None = None
+    host: str | None = None
+    status: str
+    cpu: float
+    memory_mb: int
+    error: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    expires_at: datetime | None = None
+    queue_position: int | None = None
+
+    class Config:
+        from_attributes = True
+
+class Lease(BaseModel):
+    expires_at: datetime
+
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: str
+    score: int
+
+class Leaderboard(BaseModel):
+    total: int
+    entries: list[LeaderboardEntry]
+    me: LeaderboardEntry | None = None
+
+class ProvisionItem(BaseModel):
+    machine_id: int | None = None
+    challenge_id: int | None = None
+    user_ids: list[int] = []
+
+class BulkProvisionRequest(BaseModel):
+    items: list[ProvisionItem]
+    concurrency: int | None = None
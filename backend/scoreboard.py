@@ -0,0 +1,162 @@
+import asyncio
+import os
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database, models
+
+LEADERBOARD_SYNC_INTERVAL = float(os.getenv("LEADERBOARD_SYNC_INTERVAL", "15"))
+# Machines carry no point value, so every machine flag is worth the same
+MACHINE_FLAG_POINTS = 1
+
+
+def _score_upsert(insert, user_id: int, points: int, machine_flags: int, challenge_solves: int, solved_at: datetime):
+    statement = insert(models.UserScore).values(
+        user_id=user_id,
+        score=points,
+        machine_flags=machine_flags,
+        challenge_solves=challenge_solves,
+        last_solve_at=solved_at,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[models.UserScore.user_id],
+        set_={
+            "score": models.UserScore.score + statement.excluded.score,
+            "machine_flags": models.UserScore.machine_flags + statement.excluded.machine_flags,
+            "challenge_solves": models.UserScore.challenge_solves + statement.excluded.challenge_solves,
+            "last_solve_at": statement.excluded.last_solve_at,
+        },
+    )
+    return statement.returning(models.UserScore.score, models.UserScore.last_solve_at)
+
+
+async def add_points(db: AsyncSession, user_id: int, points: int, machine_flags: int = 0, challenge_solves: int = 0) -> tuple[int, datetime]:
+    """Add a solve to the user's materialized score inside the caller's transaction.
+
+    Returns the new (score, last_solve_at); pass it to `rank_index.update`
+    once the transaction has committed.
+    """
+    statement = _score_upsert(database.dialect_insert(db.get_bind()), user_id, points, machine_flags, challenge_solves, datetime.now(timezone.utc))
+    score, solved_at = (await db.execute(statement)).one()
+    return score, solved_at
+
+
+async def lock_score(db: AsyncSession, user_id: int):
+    """Lock the user's score row for the rest of the caller's transaction, creating it if needed.
+
+    Queries run after this see every solve the user's other transactions have
+    committed, so checks like "first solve of this challenge" cannot pass twice.
+    """
+    insert = database.dialect_insert(db.get_bind())
+    statement = insert(models.UserScore).values(user_id=user_id, score=0, machine_flags=0, challenge_solves=0)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[models.UserScore.user_id],
+        set_={"score": models.UserScore.score},
+    ))
+
+
+def _timestamp(value: datetime | None) -> float:
+    if value is None:
+        return float("inf")
+    # SQLite hands back naive datetimes; everything here is UTC.
+    return (value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class RankIndex:
+    """Users ordered by score, kept in memory for the leaderboard.
+
+    Keys sort by score descending, then by who reached it first, so a rank is a
+    binary search and a page is a slice. This process updates the index as its
+    own solves commit; solves in other workers arrive with the periodic reload
+    from user_scores.
+    """
+
+    def __init__(self, interval: float = LEADERBOARD_SYNC_INTERVAL):
+        self.interval = interval
+        self._keys = []
+        self._users = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def update(self, user_id: int, username: str, score: int, solved_at: datetime | None):
+        key = (-score, _timestamp(solved_at), user_id)
+        with self._lock:
+            previous = self._users.get(user_id)
+            if previous is not None:
+                if previous[0] == key:
+                    return
+                self._discard(previous[0])
+            insort(self._keys, key)
+            self._users[user_id] = (key, username)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            previous = self._users.pop(user_id, None)
+            if previous is not None:
+                self._discard(previous[0])
+
+    def replace(self, rows: list[tuple[int, str, int, datetime | None]]):
+        users = {user_id: ((-score, _timestamp(solved_at), user_id), username) for user_id, username, score, solved_at in rows}
+        keys = sorted(key for key, _ in users.values())
+        with self._lock:
+            self._users = users
+            self._keys = keys
+
+    def entry(self, user_id: int) -> dict | None:
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is None:
+                return None
+            key, username = current
+            return {"rank": bisect_left(self._keys, key) + 1, "user_id": user_id, "username": username, "score": -key[0]}
+
+    def page(self, skip: int, limit: int) -> list[dict]:
+        with self._lock:
+            return [
+                {"rank": skip + offset + 1, "user_id": key[2], "username": self._users[key[2]][1], "score": -key[0]}
+                for offset, key in enumerate(self._keys[skip:skip + limit])
+            ]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _discard(self, key):
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+
+    async def start(self):
+        await asyncio.to_thread(self.reload)
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                print(f"Leaderboard reload failed: {e}")
+
+    def reload(self):
+        db = database.SessionLocal()
+        try:
+            rows = db.execute(
+                select(models.UserScore.user_id, models.User.username, models.UserScore.score, models.UserScore.last_solve_at)
+                .join(models.User, models.User.id == models.UserScore.user_id)
+            ).all()
+        finally:
+            db.close()
+        self.replace([tuple(row) for row in rows])
+
+
+rank_index = RankIndex()
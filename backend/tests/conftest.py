@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# database builds its engines from the environment at import time; point it at a
+# throwaway SQLite file unless a real server is given (TEST_DATABASE_URL)
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_db_dir}/test.db")
+os.environ.pop("DATABASE_REPLICA_URL", None)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+
+import auth, database, main, models
+from flag_index import flag_index
+
+
+def _setup():
+    database.Base.metadata.drop_all(database.engine)
+    database.Base.metadata.create_all(database.engine)
+    db = database.SessionLocal()
+    try:
+        user = models.User(username="player", email="player@example.com", password=auth.get_password_hash("pw"), role="user")
+        challenge = models.Challenge(title="t", description="d", category="c", difficulty="easy", points=50, is_deleted=False)
+        db.add_all([user, challenge])
+        db.commit()
+        db.add_all([
+            models.ChallengeFlag(challenge_id=challenge.id, flag="FLAG{one}", is_deleted=False),
+            models.ChallengeFlag(challenge_id=challenge.id, flag="FLAG{two}", is_deleted=False),
+        ])
+        db.commit()
+        return user.id, auth.issue_tokens(user)["access_token"], challenge.id
+    finally:
+        db.close()
+
+
+def test_concurrent_flags_of_one_challenge_score_once():
+    """Two different flags of one challenge, submitted at once, award its points once.
+
+    SQLite serialises the two writers on its own; run with TEST_DATABASE_URL set to a
+    PostgreSQL database to exercise the READ COMMITTED interleaving.
+    """
+    user_id, token, challenge_id = _setup()
+    flag_index.reload()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def submit_both():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post(f"/challenges/{challenge_id}/submit", json={"flag": flag}, headers=headers)
+                for flag in ("FLAG{one}", "FLAG{two}")
+            ))
+
+    responses = asyncio.run(submit_both())
+    assert [response.status_code for response in responses] == [200, 200]
+
+    db = database.SessionLocal()
+    try:
+        score = db.get(models.UserScore, user_id)
+        assert (score.score, score.challenge_solves) == (50, 1)
+    finally:
+        db.close()
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import docker
+
+import containers, resources, schemas
+from docker_manager import DEFAULT_DOCKER_HOST, docker_hosts, for_host
+
+WARM_POOL_MIN_SIZE = int(os.getenv("WARM_POOL_MIN_SIZE", "0"))
+WARM_POOL_MAX_SIZE = int(os.getenv("WARM_POOL_MAX_SIZE", "2"))
+# Per-image minimums, e.g. "vuln-sqli:latest=3,vuln-lfi:latest=1"
+WARM_POOL_SIZES = os.getenv("WARM_POOL_SIZES", "")
+WARM_POOL_RATE_WINDOW = float(os.getenv("WARM_POOL_RATE_WINDOW", "600"))
+WARM_POOL_LEAD_TIME = float(os.getenv("WARM_POOL_LEAD_TIME", "120"))
+WARM_POOL_REFILL_INTERVAL = float(os.getenv("WARM_POOL_REFILL_INTERVAL", "5"))
+
+POOL_LABEL = "hackharbor.pool"
+POOL_PORTS_LABEL = "hackharbor.pool.ports"
+POOL_PROFILE_LABEL = "hackharbor.pool.profile"
+WARM_NAME_PREFIX = "warm-"
+
+
+def _parse_sizes(spec: str) -> dict:
+    sizes = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        image, size = item.rsplit("=", 1)
+        sizes[image.strip()] = int(size)
+    return sizes
+
+
+class WarmPool:
+    """Keeps idle containers running per image so a start only has to rename one.
+
+    Each pool is keyed by (host, image, publish_ports, resource profile): idle
+    containers can only be claimed on the daemon they run on, and limits are
+    fixed once a container is running. Its target size follows the
+    recent start rate: enough containers to cover the starts expected during
+    WARM_POOL_LEAD_TIME, clamped to the configured min/max.
+    """
+
+    def __init__(self, min_size: int = WARM_POOL_MIN_SIZE, max_size: int = WARM_POOL_MAX_SIZE, sizes: dict | None = None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.sizes = sizes if sizes is not None else _parse_sizes(WARM_POOL_SIZES)
+        self._idle = {}
+        self._starts = {}
+        self._lock = threading.Lock()
+        self._refill_event = None
+        self._loop = None
+        self._task = None
+
+    def target_size(self, key) -> int:
+        image = key[1]
+        minimum = max(self.min_size, self.sizes.get(image, 0))
+        maximum = max(self.max_size, minimum)
+        with self._lock:
+            starts = self._prune_starts(key)
+        rate = len(starts) / WARM_POOL_RATE_WINDOW
+        return min(maximum, max(minimum, math.ceil(rate * WARM_POOL_LEAD_TIME)))
+
+    def record_start(self, key):
+        with self._lock:
+            self._starts.setdefault(key, deque()).append(time.monotonic())
+            self._idle.setdefault(key, deque())
+        self._wake()
+
+    def claim(self, image_name: str, container_name: str, publish_ports: bool = True, profile: schemas.ResourceProfile | None = None, host: str | None = None) -> str | None:
+        """Hand an idle container over to `container_name` and return its IP, or None."""
+        host = host or DEFAULT_DOCKER_HOST
+        key = (host, image_name, publish_ports, resources.profile_key(resources.resolve(profile)))
+        self.record_start(key)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                container_id, ip_address = idle.popleft()
+            manager = for_host(host)
+            # The event-fed view drops containers that died while idle, without asking the daemon
+            if manager.state.known_absent(container_id):
+                continue
+            try:
+                containers.teardown_container(container_name, host=host)
+                manager.client.api.rename(container_id, container_name)
+                manager.state.rename(container_id, container_name)
+                return ip_address
+            except docker.errors.APIError:
+                # The idle container died or vanished; drop it and try the next one.
+                containers.remove_container(container_id, host=host)
+
+    def has_idle(self, host: str, image_name: str) -> bool:
+        with self._lock:
+            return any(idle for key, idle in self._idle.items() if key[0] == host and key[1] == image_name)
+
+    def sizes_snapshot(self) -> list[dict]:
+        with self._lock:
+            idle_counts = {key: len(idle) for key, idle in self._idle.items()}
+        return [
+            {
+                "host": host,
+                "image": image,
+                "publish_ports": publish_ports,
+                "profile": json.loads(profile),
+                "idle": idle,
+                "target": self.target_size((host, image, publish_ports, profile)),
+            }
+            for (host, image, publish_ports, profile), idle in idle_counts.items()
+        ]
+
+    def reserved(self) -> list[tuple[str, schemas.ResourceProfile, int]]:
+        """Idle containers per host and profile, for capacity accounting."""
+        with self._lock:
+            idle_counts = [(key[0], key[3], len(idle)) for key, idle in self._idle.items() if idle]
+        return [(host, schemas.ResourceProfile.model_validate_json(profile), count) for host, profile, count in idle_counts]
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._refill_event = asyncio.Event()
+        default_key = resources.profile_key(resources.default_profile())
+        for image in self.sizes:
+            self._idle.setdefault((DEFAULT_DOCKER_HOST, image, True, default_key), deque())
+        await asyncio.to_thread(self._adopt_existing)
+        self._task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _prune_starts(self, key):
+        starts = self._starts.setdefault(key, deque())
+        cutoff = time.monotonic() - WARM_POOL_RATE_WINDOW
+        while starts and starts[0] < cutoff:
+            starts.popleft()
+        return starts
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._refill_event.set)
+
+    def _adopt_existing(self):
+        for host in docker_hosts:
+            self._adopt_from(host)
+
+    def _adopt_from(self, host: str):
+        # Idle containers survive a backend restart; put them back into their pools.
+        try:
+            existing = for_host(host).client.containers.list(filters={"label": POOL_LABEL})
+        except docker.errors.DockerException:
+            return
+        for container in existing:
+            # Claimed containers keep their labels but have been renamed away from warm-*.
+            if not container.name.startswith(WARM_NAME_PREFIX):
+                continue
+            image = container.labels[POOL_LABEL]
+            publish_ports = container.labels.get(POOL_PORTS_LABEL) == "true"
+            profile = container.labels.get(POOL_PROFILE_LABEL)
+            networks = container.attrs['NetworkSettings']['Networks']
+            # Containers warmed before profiles existed run without limits; replace them.
+            if profile is None or containers.VULNVERSE_NETWORK_NAME not in networks:
+                containers.remove_container(container.name, host=host)
+                continue
+            with self._lock:
+                self._idle.setdefault((host, image, publish_ports, profile), deque()).append((container.id, networks[containers.VULNVERSE_NETWORK_NAME]['IPAddress']))
+
+    def _warm_one(self, key):
+        host, image_name, publish_ports, profile = key
+        container_name = f"{WARM_NAME_PREFIX}{uuid.uuid4().hex[:12]}"
+        labels = {POOL_LABEL: image_name, POOL_PORTS_LABEL: "true" if publish_ports else "false", POOL_PROFILE_LABEL: profile}
+        ip_address = containers.run_container(
+            image_name,
+            container_name,
+            publish_ports=publish_ports,
+            labels=labels,
+            profile=schemas.ResourceProfile.model_validate_json(profile),
+            host=host
+        )
+        # run_container recorded the new container in the state view; the daemon is only asked if an event beat us to it
+        manager = for_host(host)
+        state = manager.state.get(container_name)
+        container_id = state["id"] if state is not None else manager.client.containers.get(container_name).id
+        with self._lock:
+            self._idle.setdefault(key, deque()).append((container_id, ip_address))
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refill_event.wait(), timeout=WARM_POOL_REFILL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._refill_event.clear()
+            with self._lock:
+                keys = list(self._idle.keys())
+            for key in keys:
+                target = self.target_size(key)
+                while len(self._idle.get(key, ())) < target:
+                    try:
+                        await asyncio.to_thread(self._warm_one, key)
+                    except Exception as e:
+                        print(f"Warm pool refill failed for {key[1]} on {key[0]}: {e}")
+                        break
+                # Demand dropped off; release the surplus idle containers.
+                while True:
+                    with self._lock:
+                        idle = self._idle.get(key)
+                        if not idle or len(idle) <= target:
+                            break
+                        container_id, _ = idle.pop()
+                    await asyncio.to_thread(containers.remove_container, container_id, 0, key[0])
+
+
+warm_pool = WarmPool()
+
+
+def start_container(image_name: str, container_name: str, publish_ports: bool = True, profile: schemas.ResourceProfile | None = None, host: str | None = None) -> str:
+    """Start `container_name` on `host` from a warm container when one is idle, else cold."""
+    ip_address = warm_pool.claim(image_name, container_name, publish_ports=publish_ports, profile=profile, host=host)
+    if ip_address is not None:
+        return ip_address
+    return containers.run_container(image_name, container_name, publish_ports=publish_ports, profile=profile, host=host)
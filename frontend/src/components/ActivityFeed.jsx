@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { FaUserPlus, FaFlagCheckered, FaServer } from 'react-icons/fa';
 import { formatDistanceToNow } from 'date-fns';
 import api from '../services/api';
+import { subscribeEvents } from '../services/events';
 
 const ActivityFeed = () => {
   const [activities, setActivities] = useState([]);
@@ -42,10 +43,8 @@ const ActivityFeed = () => {
           });
         }
 
-        // Sort activities by timestamp (most recent first)
-        newActivities.sort((a, b) => b.timestamp.getTime() - a.timestamp.getTime());
-
-        setActivities(newActivities);
+        // Sort activities by timestamp (most recent first), keeping any pushed while this loaded
+        setActivities(prev => [...prev, ...newActivities].sort((a, b) => b.timestamp.getTime() - a.timestamp.getTime()));
       } catch (error) {
         console.error('Failed to fetch activities:', error);
       }
@@ -54,6 +53,37 @@ const ActivityFeed = () => {
     fetchActivities();
   }, []);
 
+  // Live activity is pushed by the server and prepended as it happens
+  useEffect(() => {
+    const unsubscribeSolves = subscribeEvents('solve', (event) => {
+      if (event.data.target_type !== 'machine') {
+        return;
+      }
+      setActivities(prev => [{
+        id: `solve_${event.id}`,
+        type: 'machine_solved',
+        user: event.data.username,
+        machine: event.data.target_name,
+        timestamp: new Date(event.created_at),
+      }, ...prev]);
+    });
+    const unsubscribeMachines = subscribeEvents('machine', (event) => {
+      if (event.data.action !== 'created') {
+        return;
+      }
+      setActivities(prev => [{
+        id: `machine_${event.id}`,
+        type: 'new_machine',
+        machine: event.data.name,
+        timestamp: new Date(event.created_at),
+      }, ...prev]);
+    });
+    return () => {
+      unsubscribeSolves();
+      unsubscribeMachines();
+    };
+  }, []);
+
   const renderActivity = (activity) => {
     switch (activity.type) {
       case 'new_user':
@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useContext } from 'react';
 import MachineCard from './MachineCard';
 import api from '../services/api';
+import { subscribeEvents } from '../services/events';
 import { AuthContext } from '../contexts/AuthContext';
 
 const ActivitySection = ({ searchQuery }) => {
@@ -36,6 +37,12 @@ const ActivitySection = ({ searchQuery }) => {
     fetchAnnouncements();
   }, [token, searchQuery]);
 
+  useEffect(() => {
+    return subscribeEvents('announcement', (event) => {
+      setAnnouncements(prev => [event.data, ...prev.filter(a => a.id !== event.data.id)]);
+    });
+  }, []);
+
   return (
     <div className="py-16 px-8 bg-gray-800">
       <h2 className="text-4xl font-bold text-gray-200 text-center mb-12">What's New</h2>
@@ -59,6 +59,7 @@ function Dashboard() {
 
   const handleLogout = () => {
     localStorage.removeItem('access_token');
+    localStorage.removeItem('refresh_token');
     navigate('/login');
     addNotification('Logged out successfully.', 'info');
   };
@@ -1,5 +1,6 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import api from '../services/api';
+import { subscribeEvents } from '../services/events';
 import { useNavigate } from 'react-router-dom';
 import HeroSection from './HeroSection';
 import ActivitySection from './ActivitySection';
@@ -11,6 +12,7 @@ const DashboardPage = () => {
   const [totalMachines, setTotalMachines] = useState(0);
   const [completedMachines, setCompletedMachines] = useState(0);
   const [searchQuery, setSearchQuery] = useState('');
+  const completedIds = useRef(new Set());
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -34,6 +36,7 @@ const DashboardPage = () => {
         setScore(scoreRes.data.score);
         setTotalMachines(machinesRes.data.length);
         const completedMachineIds = new Set(submissionsRes.data.map(sub => sub.machine_id));
+        completedIds.current = completedMachineIds;
         setCompletedMachines(completedMachineIds.size);
 
       } catch (error) {
@@ -47,6 +50,22 @@ const DashboardPage = () => {
     fetchData();
   }, [navigate]);
 
+  // Our own solves arrive pushed with the new score, so there is nothing to re-poll
+  useEffect(() => {
+    if (!user) {
+      return undefined;
+    }
+    return subscribeEvents('solve', (event) => {
+      if (event.data.user_id === user.id) {
+        setScore(event.data.score);
+        if (event.data.target_type === 'machine') {
+          setCompletedMachines(prev => prev + (completedIds.current.has(event.data.target_id) ? 0 : 1));
+          completedIds.current.add(event.data.target_id);
+        }
+      }
+    });
+  }, [user]);
+
   return (
     <div className="min-h-screen bg-gray-900 text-white p-8">
       {user && (
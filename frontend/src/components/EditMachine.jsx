@@ -23,6 +23,8 @@ const EditMachine = () => {
     category: '',
   });
   const [loading, setLoading] = useState(true);
+  // Keys in config_json this form does not edit (e.g. resource limits) are kept as-is
+  const [baseConfig, setBaseConfig] = useState({});
 
   useEffect(() => {
     const fetchMachineDetails = async () => {
@@ -32,13 +34,15 @@ const EditMachine = () => {
           headers: { Authorization: `Bearer ${token}` },
         });
         const data = response.data;
+        const config = data.config_json ? JSON.parse(data.config_json) : {};
+        setBaseConfig(config);
 
         setMachineDetails({
           name: data.name,
           description: data.description,
           docker_image: data.provider === 'docker' ? data.source_identifier : '',
           vm_name: data.provider === 'virtualbox' ? data.source_identifier : '',
-          snapshot_name: data.config_json ? JSON.parse(data.config_json).snapshot_name : '',
+          snapshot_name: config.snapshot_name || '',
           category: data.category,
           release_date: data.release_date ? data.release_date.split('T')[0] : '', // Format date for input
           status: data.status || 'upcoming',
@@ -82,6 +86,9 @@ const EditMachine = () => {
   const handleSubmit = async (e) => {
     e.preventDefault();
     const token = localStorage.getItem('access_token');
+    const otherConfig = { ...baseConfig };
+    delete otherConfig.snapshot_name;
+    const config = provider === 'virtualbox' ? { ...otherConfig, snapshot_name: machineDetails.snapshot_name } : otherConfig;
     const payload = {
       name: machineDetails.name,
       description: machineDetails.description,
@@ -91,7 +98,7 @@ const EditMachine = () => {
       difficulty,
       flags: flags.map(f => ({ flag: f.flag })),
       source_identifier: provider === 'docker' ? machineDetails.docker_image : machineDetails.vm_name,
-      config_json: provider === 'virtualbox' ? JSON.stringify({ snapshot_name: machineDetails.snapshot_name }) : null,
+      config_json: Object.keys(config).length ? JSON.stringify(config) : null,
       release_date: machineDetails.release_date || null,
       status: machineDetails.status,
     };
@@ -19,7 +19,7 @@ function Login() {
         username,
         password,
       }));
-      login(response.data.access_token);
+      login(response.data.access_token, response.data.refresh_token);
       addNotification('Login successful! Welcome back.', 'success');
       navigate('/dashboard'); 
     } catch (error) {
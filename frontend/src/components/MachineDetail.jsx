@@ -1,9 +1,10 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import api from '../services/api';
+import { waitForInstance, waitForJob } from '../services/jobService';
 import { useNotification } from './Notification';
 import { jwtDecode } from 'jwt-decode';
-import { FaPlay, FaStop, FaRedo, FaFlag, FaInfoCircle, FaHistory, FaPlus, FaLinux, FaWindows, FaArrowLeft } from 'react-icons/fa';
+import { FaPlay, FaStop, FaRedo, FaFlag, FaInfoCircle, FaHistory, FaPlus, FaLinux, FaWindows, FaArrowLeft, FaHourglassHalf, FaClock } from 'react-icons/fa';
 import { motion, AnimatePresence } from 'framer-motion';
 
 function MachineDetail() {
@@ -16,14 +17,14 @@ function MachineDetail() {
   const [isStarting, setIsStarting] = useState(false);
   const [isStopping, setIsStopping] = useState(false);
   const [isRestarting, setIsRestarting] = useState(false);
+  const [isExtending, setIsExtending] = useState(false);
   const [flagsStatus, setFlagsStatus] = useState([]);
   const [flagInputs, setFlagInputs] = useState({});
   const [activeTab, setActiveTab] = useState('info');
   const [changelogEntries, setChangelogEntries] = useState([]);
   const [newChangelogEntry, setNewChangelogEntry] = useState('');
   const [isAdmin, setIsAdmin] = useState(false);
-  const [currentUserId, setCurrentUserId] = useState(null);
-  const [hasClickedStart, setHasClickedStart] = useState(false);
+  const [instance, setInstance] = useState(null);
 
   const fetchMachineDetails = async () => {
     try {
@@ -51,6 +52,33 @@ function MachineDetail() {
     }
   };
 
+  // Stopped and failed instances no longer hold the machine for this player
+  const trackInstance = (current) => {
+    setInstance(current && current.status !== 'stopped' && current.status !== 'failed' ? current : null);
+  };
+
+  // The player's own instance of this machine, if one is queued or running
+  const fetchInstance = async () => {
+    try {
+      const token = localStorage.getItem('access_token');
+      if (!token) {
+        navigate('/login');
+        return null;
+      }
+      const response = await api.get('/instances/me', {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      const current = response.data.find(item => item.machine_id === Number(machineId)) || null;
+      trackInstance(current);
+      return current;
+    } catch (err) {
+      console.error('Failed to fetch instance:', err);
+      return null;
+    }
+  };
+
   const fetchFlagsStatus = async () => {
     try {
       const token = localStorage.getItem('access_token');
@@ -100,11 +128,9 @@ function MachineDetail() {
     fetchChangelogEntries();
 
     const token = localStorage.getItem('access_token');
-    let userId = null;
     if (token) {
       try {
         const decodedToken = jwtDecode(token);
-        userId = decodedToken.id;
         if (decodedToken.role === 'admin') {
           setIsAdmin(true);
         }
@@ -112,32 +138,52 @@ function MachineDetail() {
         console.error('Error decoding token:', error);
       }
     }
-    setCurrentUserId(userId);
+
+    let cancelled = false;
+    fetchInstance().then(async (current) => {
+      // Pick up a start that was still queued or starting when the page was left
+      if (current && (current.status === 'queued' || current.status === 'starting')) {
+        setIsStarting(true);
+        try {
+          await waitForInstance(current, token, (updated) => {
+            if (!cancelled) {
+              trackInstance(updated);
+            }
+          });
+        } catch (err) {
+          console.error('Instance failed to start:', err);
+        } finally {
+          if (!cancelled) {
+            setIsStarting(false);
+          }
+        }
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
   }, [machineId, navigate]);
 
-  useEffect(() => {
-    if (machine && currentUserId && machine.ip_address && machine.active_users && machine.active_users.some(user => user.id === currentUserId)) {
-      setHasClickedStart(true);
-    } else {
-      setHasClickedStart(false);
-    }
-  }, [machine, currentUserId]);
+  const isRunning = instance?.status === 'running';
 
   const handleStartMachine = async () => {
     setIsStarting(true);
     try {
       const token = localStorage.getItem('access_token');
-      await api.post(`/machines/${machine.id}/start`, {}, {
+      const response = await api.post(`/machines/${machine.id}/instance`, {}, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
-      showNotification('Machine started!', 'success');
-      fetchMachineDetails();
-      setHasClickedStart(true);
+      setInstance(response.data);
+      const started = await waitForInstance(response.data, token, trackInstance);
+      if (started.status === 'running') {
+        showNotification('Machine started!', 'success');
+      }
     } catch (err) {
       console.error('Failed to start machine:', err);
-      showNotification(err.response?.data?.detail || 'Failed to start machine!', 'error');
+      showNotification(err.response?.data?.detail || err.message || 'Failed to start machine!', 'error');
+      setInstance(null);
     } finally {
       setIsStarting(false);
     }
@@ -147,17 +193,16 @@ function MachineDetail() {
     setIsStopping(true);
     try {
       const token = localStorage.getItem('access_token');
-      await api.post(`/machines/${machine.id}/stop`, {}, {
+      await api.delete(`/instances/${instance.id}`, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
+      setInstance(null);
       showNotification('Machine stopped!', 'success');
-      fetchMachineDetails();
-      setHasClickedStart(false);
     } catch (err) {
       console.error('Failed to stop machine:', err);
-      showNotification(err.response?.data?.detail || 'Failed to stop machine!', 'error');
+      showNotification(err.response?.data?.detail || err.message || 'Failed to stop machine!', 'error');
     } finally {
       setIsStopping(false);
     }
@@ -167,21 +212,42 @@ function MachineDetail() {
     setIsRestarting(true);
     try {
       const token = localStorage.getItem('access_token');
-      await api.post(`/machines/${machine.id}/restart`, {}, {
+      const response = await api.post(`/instances/${instance.id}/restart`, {}, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
+      await waitForJob(response.data, token);
       showNotification('Machine restarted!', 'success');
-      fetchMachineDetails();
+      fetchInstance();
     } catch (err) {
       console.error('Failed to restart machine:', err);
-      showNotification(err.response?.data?.detail || 'Failed to restart machine!', 'error');
+      showNotification(err.response?.data?.detail || err.message || 'Failed to restart machine!', 'error');
     } finally {
       setIsRestarting(false);
     }
   };
 
+  // Running instances are stopped at expires_at unless the player extends them
+  const handleExtendMachine = async () => {
+    setIsExtending(true);
+    try {
+      const token = localStorage.getItem('access_token');
+      const response = await api.post(`/instances/${instance.id}/extend`, {}, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      setInstance(current => current && { ...current, expires_at: response.data.expires_at });
+      showNotification('Machine time extended!', 'success');
+    } catch (err) {
+      console.error('Failed to extend machine:', err);
+      showNotification(err.response?.data?.detail || err.message || 'Failed to extend machine!', 'error');
+    } finally {
+      setIsExtending(false);
+    }
+  };
+
   const handleFlagInputChange = (flagId, e) => {
     setFlagInputs({ ...flagInputs, [flagId]: e.target.value });
   };
@@ -273,9 +339,22 @@ function MachineDetail() {
             {machine.operating_system === 'Windows' && <FaWindows className="mr-2" />}
             {machine.operating_system || 'N/A'}
           </span>
-          {machine.ip_address && hasClickedStart ? (
+          {isRunning ? (
             <span className="text-green-500 font-semibold flex items-center">
-              <FaPlay className="mr-2" /> Running (IP: {machine.ip_address})
+              <FaPlay className="mr-2" /> Running (IP: {instance.ip_address})
+              {instance.expires_at && (
+                <span className="ml-4 text-gray-400 font-normal flex items-center">
+                  <FaClock className="mr-2" /> Expires at {new Date(instance.expires_at).toLocaleTimeString()}
+                </span>
+              )}
+            </span>
+          ) : instance?.status === 'queued' ? (
+            <span className="text-yellow-500 font-semibold flex items-center">
+              <FaHourglassHalf className="mr-2" /> Queued{instance.queue_position ? ` (position ${instance.queue_position})` : ''}
+            </span>
+          ) : instance?.status === 'starting' ? (
+            <span className="text-yellow-500 font-semibold flex items-center">
+              <FaHourglassHalf className="mr-2" /> Starting...
             </span>
           ) : (
             <span className="text-red-500 font-semibold flex items-center">
@@ -288,25 +367,32 @@ function MachineDetail() {
         <div className="flex space-x-4 mb-8">
           <button
             onClick={handleStartMachine}
-            disabled={isStarting || isStopping || isRestarting || hasClickedStart}
+            disabled={isStarting || isStopping || isRestarting || instance !== null}
             className="px-6 py-3 bg-green-600 hover:bg-green-700 rounded-md text-white font-semibold transition-colors flex items-center justify-center disabled:opacity-50 disabled:cursor-not-allowed"
           >
-            {isStarting ? 'Starting...' : <><FaPlay className="mr-2" /> Start {machine.provider === 'docker' ? 'Container' : 'VM'}</>}
+            {isStarting ? (instance?.status === 'queued' ? 'Queued...' : 'Starting...') : <><FaPlay className="mr-2" /> Start {machine.provider === 'docker' ? 'Container' : 'VM'}</>}
           </button>
           <button
             onClick={handleStopMachine}
-            disabled={isStarting || isStopping || isRestarting || !hasClickedStart}
+            disabled={isStopping || isRestarting || instance === null}
             className="px-6 py-3 bg-red-600 hover:bg-red-700 rounded-md text-white font-semibold transition-colors flex items-center justify-center disabled:opacity-50 disabled:cursor-not-allowed"
           >
             {isStopping ? 'Stopping...' : <><FaStop className="mr-2" /> Stop Machine</>}
           </button>
           <button
             onClick={handleRestartMachine}
-            disabled={isStarting || isStopping || isRestarting}
+            disabled={isStarting || isStopping || isRestarting || !isRunning}
             className="px-6 py-3 bg-yellow-600 hover:bg-yellow-700 rounded-md text-white font-semibold transition-colors flex items-center justify-center disabled:opacity-50 disabled:cursor-not-allowed"
           >
             {isRestarting ? 'Restarting...' : <><FaRedo className="mr-2" /> Restart Machine</>}
           </button>
+          <button
+            onClick={handleExtendMachine}
+            disabled={isStopping || isRestarting || isExtending || !isRunning}
+            className="px-6 py-3 bg-blue-600 hover:bg-blue-700 rounded-md text-white font-semibold transition-colors flex items-center justify-center disabled:opacity-50 disabled:cursor-not-allowed"
+          >
+            {isExtending ? 'Extending...' : <><FaClock className="mr-2" /> Extend Time</>}
+          </button>
         </div>
 
         <div className="flex border-b border-gray-700 mb-6">
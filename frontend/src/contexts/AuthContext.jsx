@@ -1,6 +1,7 @@
 import React, { createContext, useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { jwtDecode } from 'jwt-decode';
+import api from '../services/api';
 
 export const AuthContext = createContext(null);
 
@@ -25,6 +26,7 @@ export const AuthProvider = ({ children }) => {
         setIsAuthenticated(true);
       } catch (error) {
         localStorage.removeItem('access_token');
+        localStorage.removeItem('refresh_token');
         setUser(null);
         setIsAuthenticated(false);
       }
@@ -32,8 +34,11 @@ export const AuthProvider = ({ children }) => {
     setIsLoading(false);
   }, []);
 
-  const login = (newToken) => {
+  const login = (newToken, refreshToken) => {
     localStorage.setItem('access_token', newToken);
+    if (refreshToken) {
+      localStorage.setItem('refresh_token', refreshToken);
+    }
     setToken(newToken);
     const decodedUser = jwtDecode(newToken);
     setUser({ 
@@ -46,7 +51,16 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const accessToken = localStorage.getItem('access_token');
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (accessToken) {
+      // Best effort: the tokens are dropped locally whether or not the server hears about it
+      api.post('/logout', { refresh_token: refreshToken }, {
+        headers: { Authorization: `Bearer ${accessToken}` }
+      }).catch(() => {});
+    }
     localStorage.removeItem('access_token');
+    localStorage.removeItem('refresh_token');
     setToken(null);
     setUser(null);
     setIsAuthenticated(false);
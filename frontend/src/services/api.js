@@ -5,4 +5,51 @@ const api = axios.create({
   baseURL: import.meta.env.VITE_API_BASE_URL,
 });
 
-export default api;
\ No newline at end of file
+// Access tokens are short-lived; on a 401 swap the refresh token for a new pair
+// and replay the request once. Concurrent 401s share a single refresh call.
+let refreshing = null;
+
+const refreshTokens = async () => {
+  const refreshToken = localStorage.getItem('refresh_token');
+  if (!refreshToken) {
+    throw new Error('No refresh token');
+  }
+  const response = await axios.post(`${api.defaults.baseURL ?? ''}/token/refresh`, { refresh_token: refreshToken });
+  localStorage.setItem('access_token', response.data.access_token);
+  localStorage.setItem('refresh_token', response.data.refresh_token);
+  return response.data.access_token;
+};
+
+// A fresh access token, shared by every caller while a refresh is in flight.
+// A failed refresh signs the tab out, so callers should stop retrying.
+export const refreshAccessToken = () => {
+  refreshing = refreshing ?? refreshTokens()
+    .catch((refreshError) => {
+      localStorage.removeItem('access_token');
+      localStorage.removeItem('refresh_token');
+      throw refreshError;
+    })
+    .finally(() => { refreshing = null; });
+  return refreshing;
+};
+
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const original = error.config;
+    const isAuthCall = original && ['/token', '/token/refresh', '/logout'].includes(original.url);
+    if (error.response?.status !== 401 || !original || original._retried || isAuthCall) {
+      throw error;
+    }
+    original._retried = true;
+    try {
+      const accessToken = await refreshAccessToken();
+      original.headers.Authorization = `Bearer ${accessToken}`;
+      return api(original);
+    } catch (refreshError) {
+      throw error;
+    }
+  }
+);
+
+export default api;
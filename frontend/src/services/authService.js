@@ -1,12 +1,16 @@
 import { jwtDecode } from 'jwt-decode';
 
 class AuthService {
-    login(token) {
+    login(token, refreshToken) {
         localStorage.setItem('access_token', token);
+        if (refreshToken) {
+            localStorage.setItem('refresh_token', refreshToken);
+        }
     }
 
     logout() {
         localStorage.removeItem('access_token');
+        localStorage.removeItem('refresh_token');
     }
 
     getToken() {
@@ -0,0 +1,66 @@
+import api, { refreshAccessToken } from './api';
+
+const EVENT_TYPES = ['solve', 'first_blood', 'machine', 'challenge', 'announcement', 'job'];
+const RECONNECT_DELAY_MS = 3000;
+
+// One EventSource per tab, shared by every component that subscribes.
+const listeners = new Map();
+let source = null;
+let reconnectTimer = null;
+
+const dispatch = (message) => {
+  const event = JSON.parse(message.data);
+  (listeners.get(event.type) || []).forEach(handler => handler(event));
+};
+
+const connect = () => {
+  const token = localStorage.getItem('access_token');
+  if (!token || source) {
+    return;
+  }
+  source = new EventSource(`${api.defaults.baseURL ?? ''}/events?token=${encodeURIComponent(token)}`);
+  [...EVENT_TYPES, 'lagged'].forEach(type => source.addEventListener(type, dispatch));
+  source.onerror = () => {
+    // The browser retries on its own unless the server refused us, usually because the
+    // access token in the URL expired; refresh it and start over. If the refresh fails
+    // the session is over, so stay disconnected until something subscribes after login.
+    if (source.readyState === EventSource.CLOSED) {
+      source = null;
+      clearTimeout(reconnectTimer);
+      reconnectTimer = setTimeout(async () => {
+        if (listeners.size === 0) {
+          return;
+        }
+        try {
+          await refreshAccessToken();
+        } catch (refreshError) {
+          return;
+        }
+        if (listeners.size > 0) {
+          connect();
+        }
+      }, RECONNECT_DELAY_MS);
+    }
+  };
+};
+
+export function subscribeEvents(type, handler) {
+  if (!listeners.has(type)) {
+    listeners.set(type, []);
+  }
+  listeners.get(type).push(handler);
+  connect();
+
+  return () => {
+    const handlers = (listeners.get(type) || []).filter(h => h !== handler);
+    if (handlers.length > 0) {
+      listeners.set(type, handlers);
+    } else {
+      listeners.delete(type);
+    }
+    if (listeners.size === 0 && source) {
+      source.close();
+      source = null;
+    }
+  };
+}
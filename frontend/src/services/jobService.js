@@ -0,0 +1,76 @@
+import api from './api';
+import { subscribeEvents } from './events';
+
+// The job's completion normally arrives as a pushed event; polling is only the fallback.
+const POLL_INTERVAL_MS = 5000;
+
+// Lifecycle endpoints return a queued job; wait until the orchestrator finishes it.
+export async function waitForJob(job, token) {
+  let current = job;
+  let finished = false;
+  let wake = null;
+  const unsubscribe = subscribeEvents('job', (event) => {
+    if (event.data.id === job.id) {
+      finished = true;
+      if (wake) {
+        wake();
+      }
+    }
+  });
+  try {
+    while (current.status === 'queued' || current.status === 'running') {
+      if (!finished) {
+        await new Promise(resolve => {
+          wake = resolve;
+          setTimeout(resolve, POLL_INTERVAL_MS);
+        });
+      }
+      const response = await api.get(`/jobs/${current.id}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      current = response.data;
+    }
+  } finally {
+    unsubscribe();
+  }
+  if (current.status === 'failed') {
+    throw new Error(current.error || 'Job failed');
+  }
+  return current;
+}
+
+// Instances wait in the scheduler's queue before they start; report each change until they settle.
+export async function waitForInstance(instance, token, onUpdate) {
+  let current = instance;
+  let wake = null;
+  const unsubscribe = subscribeEvents('job', (event) => {
+    if (event.data.target_type === 'instance' && event.data.target_id === instance.id && wake) {
+      wake();
+    }
+  });
+  try {
+    while (current.status === 'queued' || current.status === 'starting') {
+      await new Promise(resolve => {
+        wake = resolve;
+        setTimeout(resolve, POLL_INTERVAL_MS);
+      });
+      const response = await api.get(`/instances/${current.id}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      current = response.data;
+      if (onUpdate) {
+        onUpdate(current);
+      }
+    }
+  } finally {
+    unsubscribe();
+  }
+  if (current.status === 'failed') {
+    throw new Error(current.error || 'Instance failed to start');
+  }
+  return current;
+}